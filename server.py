@@ -3,13 +3,33 @@
 To start on localhost:8080 
 $ python server.py 
 
+For a production style server with pre-forked workers sharing the loaded dataset (needs gunicorn) 
+$ python server.py --workers 4 --threads 8 
+
+Filtered result sets are cached in an LRU sized by the RESULT_CACHE_SIZE and RESULT_CACHE_TTL 
+(seconds) environment variables. Hit/miss counters are served at /cache/stats. Data responses carry 
+etags (answered with 304 on If-None-Match) and are gzipped above GZIP_MIN_SIZE bytes. 
+`--throttle 5` (or THROTTLE_RATE=5) answers requests above 5 per second with 429 and Retry-After.
+
 """
 
 
-from typing import Any, Dict, List, Optional
-from flask import Flask, jsonify, request, abort
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from collections import OrderedDict
+from flask import Flask, Response, jsonify, request, abort
+import click
+import gc
 import json
-import copy
+import array
+import datetime
+import gzip
+import base64
+import hashlib
+import bisect
+import math
+from urllib.parse import urlencode
+import threading
+import time
 
 
 from flask.helpers import make_response, url_for
@@ -17,40 +37,363 @@ from flask.helpers import make_response, url_for
 app = Flask(__name__)
 
 import os 
-thisdir = os.path.dirname(__name__)
+thisdir = os.path.dirname(os.path.abspath(__file__))
 data_file = os.path.join(thisdir, 'data', 'fake-energy-data-min.json')
 
 
 
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+# simple paginator... the API delivers 12 facilities at a time by default - 9 pages total from 
+# fake-energy-data-min.json file. Clients may ask for up to MAX_PAGE_SIZE with `page_size`.
+
+DEFAULT_PAGE_SIZE = 12
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 500
+
+# filtered result sets are cached per query, see ResultCache
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 128))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 300))
 
-with open(data_file, 'r') as f: 
-    raw_records = json.load(f)
 
+# responses of the GET views below only depend on the dataset and the request path so they get 
+# strong etags. Bodies of at least GZIP_MIN_SIZE bytes are gzipped for clients that accept it.
+CONDITIONAL_ENDPOINTS = ('data', 'data_detail', 'data_summary', 'data_stream', 'data_batch')
+GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', 1024))
 
+# simulated throttling for testing clients offline: above THROTTLE_RATE requests per second (per 
+# process) requests get a 429 with a Retry-After header. 0 turns it off.
+THROTTLE_RATE = float(os.environ.get('THROTTLE_RATE', 0))
 
-class RecordFilterSet(object): 
-    """ On each request we use this to simulate a filtred set of chunked records
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class ColumnarStore(object): 
+    """The dataset held column by column instead of as nested dicts. Numeric fields live in typed 
+    arrays, agency and energy_type are dictionary encoded, and all energy records share one 
+    contiguous block where facility `pos` owns rows offsets[pos]:offsets[pos + 1]. Timestamps are 
+    kept as whole seconds since the epoch and usages as floats with a flag for the ones that were ints 
+    in the source. Dicts are only built by `record` when serializing.
     """
 
-    def equals(self, records, key, value):
-        return [{k:v for k,v in rec.items()} for rec in records if rec[key]==value] 
+    def __init__(self, records: Iterable[Dict[str, Any]]): 
+        self.object_id = []  # the `_id` strings
+        self.facility_id = array.array('q')
+        self.name = []
+        self.address = []
+        self.latitude = array.array('d')
+        self.longitude = array.array('d')
+        self.agency_codes = array.array('H')
+        self.agencies = []  # code -> agency
+        self.sqft = array.array('q')
+
+        self.offsets = array.array('q', [0])
+        self.timestamps = array.array('q')
+        self.energy_type_codes = array.array('H')
+        self.energy_types = []  # code -> energy_type
+        self.usages = array.array('d')
+        self.usage_is_int = array.array('B')  # 1 where the source usage was an int, so it goes back out as one
+
+        agency_lookup, energy_type_lookup = {}, {}
+        for rec in records: 
+            self.object_id.append(rec['_id'])
+            self.facility_id.append(rec['facility_id'])
+            self.name.append(rec['name'])
+            self.address.append(rec['address'])
+            self.latitude.append(rec['latitude'])
+            self.longitude.append(rec['longitude'])
+            self.agency_codes.append(self._code(rec['agency'], self.agencies, agency_lookup))
+            self.sqft.append(rec['sqft'])
+            for energy_record in rec['energy_records']: 
+                ts = datetime.datetime.fromisoformat(energy_record['timestamp'])
+                self.timestamps.append((ts - EPOCH) // datetime.timedelta(seconds=1))
+                self.energy_type_codes.append(self._code(energy_record['energy_type'], self.energy_types, energy_type_lookup))
+                self.usages.append(energy_record['usage'])
+                self.usage_is_int.append(isinstance(energy_record['usage'], int))
+            self.offsets.append(len(self.usages))
+        self._energy_type_lookup = energy_type_lookup
+
+        # each facility's rows ordered by time, and their timestamps, so time ranges are a bisect 
+        # within the facility's slice of the block
+        self.time_order = array.array('q')
+        for pos in range(len(self)): 
+            self.time_order.extend(sorted(range(self.offsets[pos], self.offsets[pos + 1]), key=self.timestamps.__getitem__))
+        self.sorted_timestamps = array.array('q', (self.timestamps[row] for row in self.time_order))
+
+    @staticmethod
+    def _code(value: str, values: List[str], lookup: Dict[str, int]) -> int: 
+        # dictionary encoding, new values get the next code. codes are stored as unsigned shorts
+        if value not in lookup: 
+            if len(values) > 0xFFFF: 
+                raise ValueError(f'more than {0xFFFF + 1} distinct values, {value!r} cannot be encoded')
+            lookup[value] = len(values)
+            values.append(value)
+        return lookup[value]
+
+    def __len__(self) -> int: 
+        return len(self.facility_id)
+
+    def get(self, pos: int, key: str) -> Any: 
+        if key == 'agency': 
+            return self.agencies[self.agency_codes[pos]]
+        if key == '_id': 
+            return self.object_id[pos]
+        return getattr(self, key)[pos]
+
+    def rows(self, pos: int, ts_gte: int=None, ts_lte: int=None, energy_type: str=None) -> Sequence[int]: 
+        """Rows of the energy block owned by facility `pos`. Without filters they come in source 
+        order, with any filter they come in timestamp order.
+        """
+        start, end = self.offsets[pos], self.offsets[pos + 1]
+        if ts_gte is None and ts_lte is None and energy_type is None: 
+            return range(start, end)
+        lo = start if ts_gte is None else bisect.bisect_left(self.sorted_timestamps, ts_gte, start, end)
+        hi = end if ts_lte is None else bisect.bisect_right(self.sorted_timestamps, ts_lte, start, end)
+        rows = self.time_order[lo:hi]
+        if energy_type is not None: 
+            code = self._energy_type_lookup.get(energy_type)
+            rows = [row for row in rows if self.energy_type_codes[row] == code]
+        return rows
+
+    def usage(self, row: int) -> Any: 
+        return int(self.usages[row]) if self.usage_is_int[row] else self.usages[row]
+
+    def energy_records(self, pos: int, **energy_filters) -> List[Dict[str, Any]]: 
+        return [
+            {
+                'timestamp': (EPOCH + datetime.timedelta(seconds=self.timestamps[row])).isoformat(), 
+                'energy_type': self.energy_types[self.energy_type_codes[row]], 
+                'usage': self.usage(row)
+            } 
+            for row in self.rows(pos, **energy_filters)
+        ]
+
+    def record(self, pos: int, **energy_filters) -> Dict[str, Any]: 
+        # same key order as the source json. energy_filters trim energy_records, see `rows`
+        return {
+            '_id': self.object_id[pos], 
+            'facility_id': self.facility_id[pos], 
+            'name': self.name[pos], 
+            'address': self.address[pos], 
+            'latitude': self.latitude[pos], 
+            'longitude': self.longitude[pos], 
+            'agency': self.agencies[self.agency_codes[pos]], 
+            'sqft': self.sqft[pos], 
+            'energy_records': self.energy_records(pos, **energy_filters)
+        }
+
 
-    def gte(self, records, key, value): 
-        return [{k:v for k,v in rec.items()} for rec in records if rec[key]>=value] 
+class RecordView(object): 
+    """A read-only list of records backed by positions in the store. Indexing or slicing it builds 
+    only the dicts asked for, so a page never materializes the rest of the result.
+    """
 
-    def lte(self, records, key, value): 
-        return [{k:v for k,v in rec.items()} for rec in records if rec[key]<=value] 
+    def __init__(self, store: ColumnarStore, positions: Sequence[int], energy_filters: Dict[str, Any]=None): 
+        self.store = store 
+        self.positions = positions 
+        self.energy_filters = energy_filters or {}
 
-    def isin(self, records, key, value): 
-        return [{k:v for k,v in rec.items()} for rec in records if value in rec[key]]
-        
+    def trimmed(self, energy_filters: Dict[str, Any]) -> 'RecordView': 
+        # the same records with their energy_records trimmed
+        return type(self)(self.store, self.positions, energy_filters)
+
+    def _build(self, pos: int) -> Dict[str, Any]: 
+        return self.store.record(pos, **self.energy_filters)
+
+    def __len__(self) -> int: 
+        return len(self.positions)
+
+    def __getitem__(self, idx): 
+        if isinstance(idx, slice): 
+            return [self._build(pos) for pos in self.positions[idx]]
+        return self._build(self.positions[idx])
+
+    def __iter__(self): 
+        return (self._build(pos) for pos in self.positions)
+
+
+class SummaryView(RecordView): 
+    """A RecordView of yearly summaries (see `_summarize`) built from the trimmed energy records."""
+
+    def _build(self, pos: int) -> Dict[str, Any]: 
+        return _summarize(self.store, pos, **self.energy_filters)
+
+
+with open(data_file, 'rb') as f: 
+    raw_bytes = f.read()
+    dataset_version = hashlib.sha1(raw_bytes).hexdigest()  # changes whenever the data file does
+    store = ColumnarStore(json.loads(raw_bytes))  # the parsed dicts are dropped once encoded
+    del raw_bytes
+
+
+
+def _state_of(address: str) -> str: 
+    # addresses look like '476 Eaton Court, Chase, NY, 3402'
+    parts = address.split(',')
+    return parts[-2].strip() if len(parts) > 1 else address.strip()
+
+
+class RecordIndex(object): 
+    """Secondary indexes over the store, built once at startup. Each filter op returns the set 
+    of matching positions in the store so a request intersects index hits instead of copying 
+    and scanning the whole dataset.
+    """
+
+    def __init__(self, store: ColumnarStore, equals=('agency',), ranges=('sqft',), contains=None): 
+        self.store = store 
+        positions = range(len(store))
+        contains = contains if contains is not None else {'address': _state_of}
+
+        # primary key lookup. setdefault keeps the first record if an id is ever repeated.
+        self._by_id = {}
+        for pos in positions: 
+            self._by_id.setdefault(store.facility_id[pos], pos)
+
+        # facility_id order for keyset (cursor) pagination 
+        self._id_order = array.array('q', sorted(positions, key=lambda pos: store.facility_id[pos]))
+        self._ids = array.array('q', (store.facility_id[pos] for pos in self._id_order))
+
+        # hash index: key -> value -> positions 
+        self._hash = {key: {} for key in equals}
+        for key, index in self._hash.items(): 
+            for pos in positions: 
+                index.setdefault(store.get(pos, key), []).append(pos)
+
+        # sorted index: key -> (sorted values, positions in the same order) for bisect 
+        self._sorted = {}
+        for key in ranges: 
+            pairs = sorted((store.get(pos, key), pos) for pos in positions)
+            self._sorted[key] = ([v for v, _ in pairs], [pos for _, pos in pairs])
+
+        # token index: key -> token -> positions whose value contains the token. The positions 
+        # are found by substring match so lookups agree exactly with a scan.
+        self._contains = {}
+        for key, tokenizer in contains.items(): 
+            tokens = set(tokenizer(store.get(pos, key)) for pos in positions)
+            self._contains[key] = {
+                token: [pos for pos in positions if token in store.get(pos, key)] for token in tokens
+            }
+
+    def get_one(self, facility_id: int) -> Optional[dict]: 
+        pos = self._by_id.get(facility_id)
+        return None if pos is None else self.store.record(pos)
+
+    def after(self, facility_id: Optional[int], positions=None, limit: int=DEFAULT_PAGE_SIZE) -> List[int]: 
+        """Keyset scan: up to `limit` positions in facility_id order whose id is greater than 
+        facility_id, restricted to `positions` when given. Starts with a bisect so earlier 
+        pages are never revisited.
+        """
+        start = 0 if facility_id is None else bisect.bisect_right(self._ids, facility_id)
+        page = []
+        for i in range(start, len(self._id_order)): 
+            pos = self._id_order[i]
+            if positions is None or pos in positions: 
+                page.append(pos)
+                if len(page) == limit: 
+                    break
+        return page
+
+    def equals(self, key, value): 
+        return set(self._hash[key].get(value, ()))
+
+    def gte(self, key, value): 
+        values, positions = self._sorted[key]
+        return set(positions[bisect.bisect_left(values, value):])
+
+    def lte(self, key, value): 
+        values, positions = self._sorted[key]
+        return set(positions[:bisect.bisect_right(values, value)])
+
+    def isin(self, key, value): 
+        tokens = self._contains[key]
+        if value in tokens: 
+            return set(tokens[value])
+        return set(pos for pos in range(len(self.store)) if value in self.store.get(pos, key))  # unindexed substring
+
+
+record_index = RecordIndex(store)
+
+
+
+def _summarize(store: ColumnarStore, pos: int, **energy_filters) -> Dict[str, Any]: 
+    """Yearly summary per energy type for facility `pos`, the same numbers summarize() in 
+    src/utils_data_manipulation.py computes on the client. Both make a single pass over the energy 
+    records in the order they are served (source order, timestamp order once energy_filters trim 
+    them, see `ColumnarStore.rows`) keeping a running [sum, count] per (energy_type, year), so the 
+    usages are added in the same order and the floats match exactly.
+    """
+    accumulators = {}
+    for row in store.rows(pos, **energy_filters): 
+        key = (store.energy_types[store.energy_type_codes[row]], (EPOCH + datetime.timedelta(seconds=store.timestamps[row])).year)
+        accumulator = accumulators.get(key)
+        if accumulator is None: 
+            accumulators[key] = [store.usages[row], 1]
+        else: 
+            accumulator[0] += store.usages[row]
+            accumulator[1] += 1 
+    return {
+        'facility_id': store.facility_id[pos], 
+        'agency': store.agencies[store.agency_codes[pos]], 
+        'sqft': store.sqft[pos], 
+        'summary': [
+            {
+                'year': year, 
+                'energy_type': energy_type, 
+                'num_records': count, 
+                'average_usage_per_sqft': round((total / count) / store.sqft[pos], 4)
+            } 
+            for (energy_type, year), (total, count) in sorted(accumulators.items())
+        ]
+    }
+
+
+
+class ResultCache(object): 
+    """A bounded LRU cache with a TTL. Maps a normalized filter tuple to its filtered result so 
+    later pages of the same query are slices of the cached result. Keeps hit/miss counters 
+    so the cache can be sized.
+    """
+
+    def __init__(self, max_size: int=RESULT_CACHE_SIZE, ttl: float=RESULT_CACHE_TTL): 
+        self.max_size = max_size 
+        self.ttl = ttl 
+        self.hits = 0 
+        self.misses = 0 
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key): 
+        with self._lock: 
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic(): 
+                self._entries.pop(key, None)
+                self.misses += 1 
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1 
+            return entry[1]
+
+    def put(self, key, value) -> None: 
+        if self.max_size < 1: 
+            return 
+        with self._lock: 
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size: 
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]: 
+        return {
+            'hits': self.hits, 
+            'misses': self.misses, 
+            'size': len(self._entries), 
+            'max_size': self.max_size, 
+            'ttl': self.ttl
+        }
+
+
+result_cache = ResultCache()
 
 
-# simple paginator... the API delivers 12 facilities at a time - 9 pages total from 
-# fake-energy-data-min.json file.
 
 class ResponseSchema(object): 
 
@@ -71,12 +414,16 @@ class ResponseSchema(object):
 
 
 class DB(object): 
-    """Simulates a simple paginating database. 
+    """Simulates a simple paginating database. Pages are sliced out of the record list on 
+    demand so asking for page k never builds pages 1..k-1.
     """
 
-    def __init__(self, records: List[List[Dict[str, Any]]]): 
+    def __init__(self, records: Sequence[Dict[str, Any]], page_size: int=DEFAULT_PAGE_SIZE, query: str=''): 
         self.records = records 
-        self.count = sum([len(r) for r in records])
+        self.page_size = page_size
+        self.count = len(records)
+        self.num_pages = -(-self.count // page_size)
+        self.query = query  # extra query args carried over to the next/prev urls
 
     def _index(self, page_num: int=None) -> int: 
         # convert page num to index in records
@@ -85,25 +432,24 @@ class DB(object):
         return page_num - 1
 
     def _next_url(self, idx: int=None)-> Optional[str]: 
-        # next will be i + 2 unless idx == len(records)
-        if idx == len(self.records) - 1: 
+        # next will be i + 2 unless idx == num_pages
+        if idx == self.num_pages - 1: 
             return None
-        return f'?page={idx+2}'
+        return f'?page={idx+2}{self.query}'
 
 
     def _prev_url(self, idx: int=None) -> Optional[str]: 
         if idx == 0:
             return None
-        return f'?page={idx}'
+        return f'?page={idx}{self.query}'
 
 
     def page(self, base_url: str='', page_num:int=None) -> ResponseSchema:
 
-        if len(self.records) != 1:  # if we only have 1 page of data we bypass this logic
-            if page_num < 1:
-                raise ValueError('Page num must be greater then or equal to 1.')
-            if page_num > len(self.records):
-                return ResponseSchema()
+        if page_num < 1:
+            raise ValueError('Page num must be greater then or equal to 1.')
+        if page_num > self.num_pages:  # past the end, no records and no next link to follow
+            return ResponseSchema()
 
         db_index = self._index(page_num)
 
@@ -113,53 +459,264 @@ class DB(object):
         next_url = base_url + next_page if next_page is not None else next_page
         prev_url = base_url + prev_page if prev_page is not None else prev_page
 
-        records = self.records[db_index]
+        start = db_index * self.page_size
+        records = self.records[start:start + self.page_size]
         
         return ResponseSchema(next_url, prev_url, self.count, records)
     
 
-    def get_one(self, facility_id: int) -> Optional[dict]:
+def _page_size(value: Optional[str]) -> int: 
+    # page_size must be a positive int. Anything above MAX_PAGE_SIZE is clamped.
+    if value is None: 
+        return DEFAULT_PAGE_SIZE
+    page_size = int(value)
+    if page_size < 1: 
+        raise ValueError
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def _encode_cursor(facility_id: int) -> str: 
+    return base64.urlsafe_b64encode(str(facility_id).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Optional[int]: 
+    # an empty cursor starts from the beginning. Raises ValueError on garbage.
+    if cursor == '': 
+        return None
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Dict[str, Any]]: 
+    # 'facility_id,energy_records.usage' -> {'facility_id': None, 'energy_records': {'usage': None}} 
+    # where None selects the whole value. No fields means no projection.
+    if not fields: 
+        return None
+    spec = {}
+    for field in fields.split(','): 
+        field = field.strip()
+        if not field: 
+            continue
+        node = spec
+        *parents, leaf = field.split('.')
+        for part in parents: 
+            if part in node and node[part] is None:  # the whole value is already selected
+                break
+            node = node.setdefault(part, {})
+        else: 
+            node[leaf] = None
+    return spec
 
-        for chunk in self.records:
-            for r in chunk:
-                if r['facility_id'] == facility_id: 
-                    return r  
-    
 
-    
-@app.route('/data/')
-def data():
+def _project(value: Any, spec: Optional[Dict[str, Any]]) -> Any: 
+    # apply a `fields` projection to a record, lists of nested records are projected item by item
+    if spec is None: 
+        return value
+    if isinstance(value, list): 
+        return [_project(item, spec) for item in value]
+    if isinstance(value, dict): 
+        return {k: _project(v, spec[k]) for k, v in value.items() if k in spec}
+    return value
 
-    page_num = request.args.get('page')
 
-    # filter by these query strings and chunk here... cheeky move.   
-    query_strings = [
-        ('agency', 'agency', 'equals', str), 
-        ('sqft_lte', 'sqft', 'lte', int), 
-        ('sqft_gte', 'sqft', 'gte', int),
-        ('address_contains', 'address', 'isin', str)
-    ]
-    
-    filterset = RecordFilterSet()
-    
-    records = copy.deepcopy(raw_records) # we whittle down this copy within the request
-    
-    for param, key, op, t in query_strings: 
-        val = request.args.get(param)
+def _carried_query(*exclude: str) -> str: 
+    # the request's own query args (filters, page_size) so next/prev urls are self contained
+    args = [(k, v) for k, v in request.args.items(multi=True) if k not in exclude]
+    return '&' + urlencode(args) if args else ''
+
+
+# filter by these query strings and chunk here... cheeky move.   
+QUERY_STRINGS = [
+    ('agency', 'agency', 'equals', str), 
+    ('sqft_lte', 'sqft', 'lte', int), 
+    ('sqft_gte', 'sqft', 'gte', int),
+    ('address_contains', 'address', 'isin', str)
+]
+
+
+def _parse_filters(args) -> Tuple[Tuple[str, Any], ...]: 
+    # cast the filter args into a normalized tuple (QUERY_STRINGS order) that doubles as the cache key
+    filters = []
+    for param, _, _, t in QUERY_STRINGS: 
+        val = args.get(param)
         if val:
             try:
                 val = t(val)  # cast or handle failure... the sqft params must be able to be cast to int
             except ValueError: 
-                return make_response(jsonify(detail=f'{param} must be of type {str(t)}'))
-            filter_op = getattr(filterset, op)
-            records = filter_op(records, key, val)
+                raise ValueError(f'{param} must be of type {str(t)}')
+            filters.append((param, val))
+    return tuple(filters)
+
+
+def _parse_energy_filters(args) -> Dict[str, Any]: 
+    # ts_gte / ts_lte are iso timestamps (or dates), energy_type is matched exactly. a date alone is 
+    # midnight, so ts_lte=2018-12-31 leaves out the rest of that day. the stored timestamps are naive 
+    # utc, an aware bound is converted to utc first
+    energy_filters = {}
+    for param in ('ts_gte', 'ts_lte'): 
+        val = args.get(param)
+        if val:
+            try:
+                ts = datetime.datetime.fromisoformat(val)
+            except ValueError: 
+                raise ValueError(f'{param} must be an iso formatted timestamp')
+            if ts.tzinfo is not None: 
+                ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            energy_filters[param] = (ts - EPOCH) // datetime.timedelta(seconds=1)
+    if args.get('energy_type'): 
+        energy_filters['energy_type'] = args.get('energy_type')
+    return energy_filters
+
+
+def _filtered(filters: Tuple[Tuple[str, Any], ...]) -> Tuple[Optional[Set[int]], RecordView]: 
+    """Intersects the index hits for the given filters. Returns the matching positions (None means 
+    every record) and a view of the matching records in dataset order. Results are cached so paging 
+    through the same query only filters once.
+    """
+    cached = result_cache.get(filters)
+    if cached is not None: 
+        return cached
+
+    ops = {param: (key, op) for param, key, op, _ in QUERY_STRINGS}
+    positions = None  # None means every record matched
+    for param, val in filters: 
+        key, op = ops[param]
+        hits = getattr(record_index, op)(key, val)
+        positions = hits if positions is None else positions & hits
+
+    # keep the original dataset order so pages are stable
+    records = RecordView(store, range(len(store)) if positions is None else array.array('q', sorted(positions)))
+    result_cache.put(filters, (positions, records))
+    return positions, records
+
     
+def _etag() -> str: 
+    return hashlib.sha1(f'{dataset_version}:{request.full_path}'.encode()).hexdigest()
+
+
+class Throttle(object): 
+    """A token bucket refilled at `rate` requests per second that holds at most `burst` tokens."""
+
+    def __init__(self, rate: float=THROTTLE_RATE, burst: int=None): 
+        self.rate = rate 
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> Optional[float]: 
+        # None when the request may go ahead, otherwise the seconds until a token is free
+        with self._lock: 
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1: 
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+throttle = Throttle()
+
+
+@app.before_request
+def throttled(): 
+    if throttle.rate <= 0: 
+        return None
+    wait = throttle.take()
+    if wait is None: 
+        return None
+    response = make_response(jsonify(detail='Too many requests.'), 429)
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+@app.before_request
+def not_modified(): 
+    # answer a matching If-None-Match before doing any work. Either encoding of the body matches.
+    if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS: 
+        return None
+    etag = _etag()
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + '-gz'): 
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+@app.after_request
+def conditional_and_compressed(response): 
+    if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS or response.status_code != 200: 
+        return response
+    etag = _etag()
+    response.vary.add('Accept-Encoding')
+    if (not response.is_streamed and 'gzip' in request.accept_encodings 
+            and response.content_length is not None and response.content_length >= GZIP_MIN_SIZE): 
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gz'  # a strong etag must differ per encoding
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/data/')
+def data():
+    """List view. Filter with `agency`, `sqft_lte`, `sqft_gte` and `address_contains`. Pages are 
+    either numbered with `page` or walked in facility_id order with an opaque `cursor` (pass an 
+    empty `cursor=` to start). `page_size` defaults to DEFAULT_PAGE_SIZE. `fields` limits each 
+    record to a comma separated list of keys, nested keys are dotted (`energy_records.usage`). 
+    `ts_gte`, `ts_lte` and `energy_type` trim each facility's energy_records, which then come in 
+    timestamp order. A date-only `ts_lte` means midnight of that day.
+    """
+
+    page_num = request.args.get('page')
+    cursor = request.args.get('cursor')
+
+    try:
+        page_size = _page_size(request.args.get('page_size'))
+    except ValueError: 
+        return make_response(jsonify(detail=f'page_size must be an integer between 1 and {MAX_PAGE_SIZE}.'), 400)
+
+    try:
+        filters = _parse_filters(request.args)
+    except ValueError as err: 
+        return make_response(jsonify(detail=str(err)))
+
+    try:
+        energy_filters = _parse_energy_filters(request.args)
+    except ValueError as err: 
+        return make_response(jsonify(detail=str(err)), 400)
+
+    positions, records = _filtered(filters)
+    records = records.trimmed(energy_filters)
+    projection = _parse_fields(request.args.get('fields'))
+
+    if cursor is not None: 
+        try:
+            after = _decode_cursor(cursor)
+        except ValueError: 
+            return make_response(jsonify(detail='Invalid cursor.'), 400)
+
+        count = len(store) if positions is None else len(positions)
+        if count == 0: 
+            return ResponseSchema().dict()
+
+        page = record_index.after(after, positions, page_size + 1)  # one extra to know if there is a next page
+        next_url = None
+        if len(page) > page_size: 
+            page = page[:page_size]
+            last_id = store.facility_id[page[-1]]
+            next_url = f'{request.base_url}?cursor={_encode_cursor(last_id)}{_carried_query("page", "cursor")}'
+        return ResponseSchema(next_url, None, count, [_project(store.record(pos, **energy_filters), projection) for pos in page]).dict()
+
+    return _paged(records, page_num, page_size, projection)
+
+
+def _paged(records: Sequence[Dict[str, Any]], page_num: Optional[str], page_size: int, projection=None): 
+    # numbered page of records for the current request
     if len(records) == 0: # early return if there are no records
         return ResponseSchema().dict()
 
-    records = list(chunks(records, 12))  # hardcode page_size = 12
-    
-    db = DB(records)   # now we can paginate 
+    db = DB(records, page_size, _carried_query('page'))   # now we can paginate 
 
     try:
         if page_num is None: 
@@ -167,30 +724,156 @@ def data():
         else: 
             page_num = int(page_num)
 
-    except TypeError:
+    except (TypeError, ValueError):
         return make_response(jsonify(detail="Page must be an integer."), 400)
 
     try:
         data = db.page(request.base_url, page_num)
+        data.records = [_project(record, projection) for record in data.records]
         return data.dict()
         
     except ValueError as err: 
         return make_response(jsonify(detail=str(err)), 400)
-    
+
+
+@app.route('/data/summary')
+def data_summary(): 
+    """Per facility yearly summaries in the SummaryFakeEnergyFacilityModel shape. Takes the same 
+    filters as the list view and pages with `page` and `page_size`. Only the summaries of the 
+    requested page are computed, from the columnar store, so they take no memory between requests. 
+    With `ts_gte`, `ts_lte` or `energy_type` only the trimmed energy records are summarized.
+    """
+    try:
+        page_size = _page_size(request.args.get('page_size'))
+    except ValueError: 
+        return make_response(jsonify(detail=f'page_size must be an integer between 1 and {MAX_PAGE_SIZE}.'), 400)
+
+    try:
+        filters = _parse_filters(request.args)
+    except ValueError as err: 
+        return make_response(jsonify(detail=str(err)))
+
+    try:
+        energy_filters = _parse_energy_filters(request.args)
+    except ValueError as err: 
+        return make_response(jsonify(detail=str(err)), 400)
+
+    _, records = _filtered(filters)
+    return _paged(SummaryView(store, records.positions, energy_filters), request.args.get('page'), page_size)
+
+
+@app.route('/data/stream')
+def data_stream(): 
+    """Bulk export. Applies the same filters as the list view and writes every matching record 
+    as newline delimited json from a generator so the response is never built in memory.
+    """
+    try:
+        filters = _parse_filters(request.args)
+        energy_filters = _parse_energy_filters(request.args)
+    except ValueError as err: 
+        return make_response(jsonify(detail=str(err)), 400)
+
+    _, records = _filtered(filters)
+    records = records.trimmed(energy_filters)
+    projection = _parse_fields(request.args.get('fields'))
+
+    def generate(): 
+        for record in records: 
+            yield json.dumps(_project(record, projection)) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/data/batch', methods=['GET', 'POST'])
+def data_batch(): 
+    """Many detail records in one response. Ids come from `?ids=1,2,3` or a POSTed json body 
+    of the form {"ids": [1, 2, 3]}. Records are returned in the requested order and ids that 
+    do not exist are listed under `missing`.
+    """
+    try:
+        if request.method == 'POST': 
+            body = request.get_json(silent=True) or {}
+            ids = body.get('ids', [])
+            if not isinstance(ids, list): # a string would be iterated one digit at a time 
+                raise TypeError
+            ids = [int(i) for i in ids]
+        else: 
+            ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except (TypeError, ValueError, AttributeError): 
+        return make_response(jsonify(detail='ids must be a list of integers.'), 400)
+
+    if len(ids) > MAX_BATCH_SIZE: 
+        return make_response(jsonify(detail=f'At most {MAX_BATCH_SIZE} ids per batch.'), 400)
+
+    projection = _parse_fields(request.args.get('fields'))
+    records, missing = [], []
+    for facility_id in ids: 
+        record = record_index.get_one(facility_id)
+        if record is None: 
+            missing.append(facility_id)
+        else: 
+            records.append(_project(record, projection))
+    return {'count': len(records), 'records': records, 'missing': missing}
+
+
+@app.route('/cache/stats')
+def cache_stats(): 
+    return result_cache.stats()
+
 
 @app.route(f'/data/<int:facility_id>')
 def data_detail(facility_id): 
-    
-    records = list(chunks(raw_records, 12))
-    
-    db = DB(records)
 
-    record = db.get_one(facility_id)
+    record = record_index.get_one(facility_id)
 
     if record is None: 
         return make_response(jsonify(detail='Not Found.'), 404)
-    return record
+    return _project(record, _parse_fields(request.args.get('fields')))
+
+
+def serve(host: str='0.0.0.0', port: int=8080, workers: int=4, threads: int=4, graceful_timeout: int=30) -> None: 
+    """Production mode. The dataset and indexes are already loaded when this runs so 
+    gunicorn forks its workers from this process and they share the data read-only through 
+    copy-on-write instead of each parsing the json. SIGTERM drains in-flight requests for up to 
+    graceful_timeout seconds before the workers exit.
+    """
+    from gunicorn.app.base import BaseApplication  # optional, only needed for this mode
+
+    class Server(BaseApplication): 
+
+        def load_config(self): 
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('preload_app', True)
+            self.cfg.set('graceful_timeout', graceful_timeout)
+
+        def load(self): 
+            return app
+
+    # move everything loaded so far out of the gc's reach so collections in the workers do not 
+    # touch (and therefore copy) the shared pages
+    gc.freeze()
+    Server().run()
+
+
+@click.command()
+@click.option('--host', default='0.0.0.0', help='interface to bind')
+@click.option('--port', default=8080, help='port to bind')
+@click.option('--workers', '-w', default=0, help='number of pre-forked worker processes. 0 runs the flask development server')
+@click.option('--threads', '-t', default=4, help='threads per worker process')
+@click.option('--graceful_timeout', default=30, help='seconds workers get to finish requests on shutdown')
+@click.option('--throttle', 'throttle_rate', default=THROTTLE_RATE, help='simulate throttling above this many requests per second with 429s. 0 turns it off')
+def main(host, port, workers, threads, graceful_timeout, throttle_rate): 
+    ''' Runs the fake REST API server '''
+    global throttle 
+    throttle = Throttle(throttle_rate)
+    if workers < 1: 
+        app.run(host, port, debug=True)
+    else: 
+        serve(host, port, workers, threads, graceful_timeout)
 
 
 if __name__ == '__main__': 
-    app.run('0.0.0.0', 8080, debug=True)
+    main()
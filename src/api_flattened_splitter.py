@@ -3,27 +3,34 @@ Write a script that uses the same business logic in `api_splitter.py` to build t
 '''
 
 import os 
+import click 
 import pathlib 
 from schemas import FakeEnergyFacilityModel, FlattenFakeEnergyFacilityModel
-from utils_data_manipulation import fetch_data, list_of_agencies_in, pydantic_converter_of, flatten, sort, categorize
+from utils_data_manipulation import fetch_many_queries, list_of_agencies_in, pydantic_converter_of, flatten, sort, categorize
+from http_file import DISK_CACHE_MAX_AGE, configure_disk_cache
 from utils_IO_bound import api_splitter
-from itertools import chain
 
 
 this_dir = os.path.dirname(os.path.realpath(__file__))  
 
 
-def main():
+@click.command()  
+@click.option('--cache-dir', default=None, help='directory for an on-disk cache of API responses, off by default')  
+@click.option('--max-age', default=DISK_CACHE_MAX_AGE, help='seconds a cached API response is used without asking the server')  
+def main(cache_dir, max_age):
+    ''' A CLI that writes the NY and NJ datasets as flattened csv, optionally caching API responses on disk '''
+    if cache_dir:
+        configure_disk_cache(cache_dir, max_age=max_age)
     dir_filepath = pathlib.Path(this_dir) / 'project_data' / 'api_flatten_splitter'
     list_of_states, sqft_gte_param = ['NY','NJ'], 30000
     url = 'http://localhost:8080' + '/data/'
-    list_of_datasets = [fetch_data(url, address_contains=state, sqft_gte=sqft_gte_param) for state in list_of_states]
-    dataset = list(chain.from_iterable(list_of_datasets))
+    dataset = fetch_many_queries(url, {state: dict(address_contains=state, sqft_gte=sqft_gte_param) for state in list_of_states}, tag='states')
+    states_of = {data_obj['facility_id']: data_obj['states'] for data_obj in dataset}
     list_of_inst_models = pydantic_converter_of(dataset, FakeEnergyFacilityModel)
     list_of_agencies = list_of_agencies_in(list_of_inst_models)
-    list_of_flat_models = flatten(list_of_inst_models,FlattenFakeEnergyFacilityModel)
+    list_of_flat_models = flatten(list_of_inst_models,FlattenFakeEnergyFacilityModel,trusted=True) # validated by pydantic_converter_of
     list_of_sorted_models = sort(list_of_flat_models, 'facility_id','energy_type','timestamp','agency')
-    categorized_dataset = categorize(list_of_sorted_models, 'address', list_of_states) 
+    categorized_dataset = categorize(list_of_sorted_models, 'address', list_of_states, tags=states_of) 
     if not dir_filepath.exists():
         dir_filepath.mkdir()
     api_splitter('csv', list_of_agencies, categorized_dataset, dir_filepath) 
@@ -0,0 +1,156 @@
+"""The asyncio twin of `http_file`. Every coroutine shares an `AsyncClient`, an aiohttp session plus
+a semaphore that bounds how many requests are in flight and a rate limit on how often a request may
+start. This lets hundreds of queries run on one event loop without a thread per query. Requests also
+go through http_file's process wide rate limiter, retry policy, circuit breaker, metrics and disk
+cache, so sync and async callers back off together and share cached pages.
+ex.
+>>> async with AsyncClient(max_in_flight=20) as client:
+        async for status, data in apaginator(url, client, agency='A'):
+            print(status, data)
+"""
+
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, Dict, Tuple
+import aiohttp
+from http_file import DEFAULT_HEADERS, POOL_SIZE, THROTTLE_STATUS_CODES, _cache_key, _params_not_in, get_breaker, get_disk_cache, get_limiter, get_metrics, get_retry_policy
+
+
+class AsyncRateLimiter(object):
+    """Spaces out request starts by at least `interval` seconds across every coroutine sharing it."""
+
+    def __init__(self, interval: float=0.0):
+        self.interval = interval
+        self._next_slot = 0.0
+
+    async def wait(self) -> None:
+        # the event loop is single threaded so reserving the slot needs no lock
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncClient(object):
+    """An aiohttp session with a bounded number of requests in flight and a shared rate limit. Use it as
+    an async context manager so the session is closed.
+
+    Args:
+        max_in_flight (int, optional): Requests allowed in flight at once. Defaults to 100.
+        interval (float, optional): Minimum spacing in seconds between request starts. Defaults to 0.
+        pool_size (int, optional): Connections kept open. Defaults to http_file.POOL_SIZE.
+        headers (Dict[str, str], optional): Headers sent with every request on top of DEFAULT_HEADERS.
+    """
+
+    def __init__(self, max_in_flight: int=100, interval: float=0.0, pool_size: int=POOL_SIZE, headers: Dict[str, str]=None):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.limiter = AsyncRateLimiter(interval)
+        self.pool_size = pool_size
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.session = None
+
+    async def __aenter__(self) -> 'AsyncClient':
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size), headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+
+
+async def afetch(url: str, client: AsyncClient, raise_for_status: bool=True, **query_params) -> Tuple[int, Dict[str, Any]]:
+    """Fetches data from the specified url once the client's semaphore and rate limit allow it.
+    Transient failures are retried and the circuit breaker is honoured, like http_file.fetch.
+
+    Args:
+        url (str): The request url.
+        client (AsyncClient): An open client.
+        raise_for_status(bool, optional): Whether to raise on an error code. Defaults to True.
+        **query_params (optional): Optional key word args to support to query the database.
+
+    Raises:
+        aiohttp.ClientResponseError: if raise_for_status is set to true.
+        http_file.CircuitOpenError: if the circuit breaker is open.
+
+    Returns:
+        Tuple[int, Dict[str, Any]]: A tuple of status code followed by the data.
+    """
+    policy, breaker, limiter, metrics = get_retry_policy(), get_breaker(), get_limiter(), get_metrics()
+    disk_cache, disk_key = get_disk_cache(), _cache_key(url, query_params)
+    loop = asyncio.get_running_loop() # disk cache reads and writes run in the default executor, off the event loop
+    stored = await loop.run_in_executor(None, disk_cache.get, disk_key) if disk_cache is not None else None
+    if stored is not None and stored[2]:
+        return (200, json.loads(stored[1]))
+    headers = {'If-None-Match': stored[0]} if stored is not None and stored[0] else {}
+    async with client.semaphore:
+        attempt = 0
+        while True:
+            breaker.allow()
+            started = time.monotonic()
+            answered = False
+            try:
+                await client.limiter.wait()
+                delay = limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                started = time.monotonic()
+                async with client.session.get(url, params=query_params, headers=headers) as res_obj:
+                    metrics.record(url, attempt, res_obj.status, None, time.monotonic() - started)
+                    limiter.observe(res_obj.status, res_obj.headers.get('Retry-After'))
+                    if res_obj.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    answered = True
+                    if res_obj.status not in policy.status_codes or attempt >= policy.retries:
+                        if headers and res_obj.status == 304:
+                            await loop.run_in_executor(None, disk_cache.put, disk_key, *stored[:2]) # fresh for another max_age
+                            return (200, json.loads(stored[1]))
+                        if raise_for_status:
+                            res_obj.raise_for_status()
+                        body = await res_obj.read()
+                        if disk_cache is not None and res_obj.status == 200:
+                            await loop.run_in_executor(None, disk_cache.put, disk_key, res_obj.headers.get('ETag'), body)
+                        return (res_obj.status, json.loads(body))
+                    status = res_obj.status
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                metrics.record(url, attempt, None, type(exc).__name__, time.monotonic() - started)
+                breaker.record_failure()
+                if attempt >= policy.retries:
+                    raise
+                status = None
+            except BaseException as exc: # a half open breaker must not wait for a trial that never got an answer
+                if not answered:
+                    metrics.record(url, attempt, None, type(exc).__name__, time.monotonic() - started)
+                    breaker.abandon_trial()
+                raise
+            if status not in THROTTLE_STATUS_CODES: # the limiter already paces throttled retries
+                await asyncio.sleep(policy.delay(attempt))
+            attempt += 1
+
+
+async def apaginator(url: str, client: AsyncClient, timeout: float=None, **kwargs) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+    """The async generator version of `http_file.paginator`. Follows `next` until it is None. An
+    optional fixed `timeout` pause between pages is awaited, which leaves the event loop free.
+
+    Args:
+        url (str): The url.
+        client (AsyncClient): An open client.
+        timeout (float, optional): A fixed pause in between paginating calls. Defaults to None, no pause.
+        **kwargs (optional): Optional keyword args that get forwarded as query params.
+
+    Yields:
+        AsyncGenerator[Tuple[int, Dict[str, Any]]]: Yields a tuple of status code and dictionary.
+    """
+    while True:
+        status, data = await afetch(url, client, **kwargs)
+        yield status, data
+        next_url = data['next']
+        if next_url is None:
+            break
+        url = next_url
+        kwargs = _params_not_in(url, kwargs)
+        if timeout:
+            await asyncio.sleep(timeout)
@@ -8,42 +8,56 @@ Like fetch_one we will print the result to stdout using `click.echo` and the use
 '''
 
 import os
+import sys
 from typing import Any 
 import click 
 import json 
-from utils_data_manipulation import fetch_data, pydantic_converter_of
+from http_file import configure_retries
+from utils_data_manipulation import iter_records, pydantic_converter_of
 from schemas import FakeEnergyFacilityModel
 this_dir = os.path.dirname(os.path.realpath(__file__))
 
 
-def fetch_many(keyword:Any, base_url:str) -> None:
+def fetch_many(keyword:Any, base_url:str, limit:int=None) -> None:
     ''' CLI which makes API call according to query params, stdout result and converts result into list of pydantic models
+        records are validated and echoed one by one as they arrive so piping into `head` stops the download early 
         Args:
             keyword: -kw inputs from user 
             base_url: basic url string 
+            limit: stop after this many records, None for all of them 
         Returns:
             None 
     '''
+    separator = '[' # written with the first record so a failed first request echoes only the error 
     try:
         kw_dict = {}
         for kw in keyword: #itr thr tuple 
             splitted = kw.split('=') # split str on = 
             kw_dict[splitted[0]] = splitted[1] # assign to dict 
-        dataset = fetch_data(base_url, **kw_dict)
-        list_of_inst_models = pydantic_converter_of(dataset, FakeEnergyFacilityModel)
-        dataset = [json.loads(model_obj.json()) for model_obj in list_of_inst_models]
-        click.echo(json.dumps(dataset))
+        for data_obj in iter_records(base_url, limit, **kw_dict):
+            model_obj = pydantic_converter_of([data_obj], FakeEnergyFacilityModel)[0]
+            click.echo(separator + json.dumps(json.loads(model_obj.json())), nl=False) # same layout as json.dumps(list) 
+            separator = ', '
+        click.echo('[]' if separator == '[' else ']')
     except Exception: # NOTE think more abt that 
-        click.echo('http error, please check url')
+        if separator == '[':
+            click.echo('http error, please check url')
+        else: # records were written already, keep stdout valid json and fail loudly 
+            click.echo(']')
+            click.echo('http error, please check url, the output is incomplete', err=True)
+            sys.exit(1)
 
 
 url = 'http://localhost:8080' + '/data/'
 @click.command()  
 @click.option('--keyword','-kw',help='URL address to API',multiple=True)
 @click.option('--base_url','-url',default=url,help='URL address to API')
-def main(keyword, base_url):
+@click.option('--retries',default=5,help='times a failed request is retried with backoff before giving up')
+@click.option('--limit','-l',default=None,type=int,help='stop after this many records')
+def main(keyword, base_url, retries, limit):
     ''' a CLI that fetches a single record filtered by keyword argument '''
-    fetch_many(keyword,base_url)
+    configure_retries(retries=retries)
+    fetch_many(keyword,base_url,limit)
 
 
 
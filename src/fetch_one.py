@@ -2,12 +2,22 @@
 This application should take as an argument a facility_id and as an optional argument the base_url with the default of `http://localhost:8080`. It will 
 simply reach out to the API and print the result to stdout using `click.echo`. A user should be able to pipe the output to a correctly formmatted json 
 file using bash whether the request succeeds or not.
+
+Many facility ids can be given as arguments or, with no arguments, read from stdin. They are fetched in batches through the 
+`/data/batch` endpoint and printed as a json list, which is also what ids read from stdin give even when there is only one. 
+```
+$ python fetch_one.py 1 2 3 
+$ cat ids.txt | python fetch_one.py -bs 200 
+```
 '''
 
 import os 
+import sys
+import json 
+from typing import List
 import click 
-from http_file import fetch 
-from utils_data_manipulation import pydantic_converter_of
+from http_file import configure_retries, fetch 
+from utils_data_manipulation import fetch_by_ids, pydantic_converter_of
 from schemas import FakeEnergyFacilityModel
 
 this_dir = os.path.dirname(os.path.realpath(__file__))  
@@ -30,13 +40,36 @@ def fetch_one(facility_id:str, base_url:str) -> None:
         click.echo('http error, please check url') #NOTE echoing the msg from Exception is better 
     
 
+def fetch_batch(facility_ids:List[str], base_url:str, batch_size:int) -> None:
+    ''' makes batched api calls to fetch many records, user can pipe the json list to file
+        Args:
+            facility_ids: user inputs facility id numbers 
+            base_url: optional base url with default 
+            batch_size: number of ids per api call 
+        Returns:
+            None
+    '''
+    try:
+        dataset = fetch_by_ids(base_url, facility_ids, batch_size)
+        list_of_inst_models = pydantic_converter_of(dataset, FakeEnergyFacilityModel)
+        click.echo(json.dumps([json.loads(model_obj.json()) for model_obj in list_of_inst_models]))
+    except Exception: 
+        click.echo('http error, please check url')
+
+
 url = 'http://localhost:8080'
 @click.command() 
-@click.argument('facility_id') 
+@click.argument('facility_ids', nargs=-1) 
 @click.option('--base_url', '-url', default=url, help='URL address to API')  
-def main(facility_id, base_url):
-    ''' A CLI that fetches a single record from an backend API server via facility_id '''
-    fetch_one(facility_id,base_url)
+@click.option('--batch_size', '-bs', default=100, help='number of ids per API call when fetching many records')  
+@click.option('--retries', default=5, help='times a failed request is retried with backoff before giving up')  
+def main(facility_ids, base_url, batch_size, retries):
+    ''' A CLI that fetches records from an backend API server via facility_id. With no ids they are read from stdin '''
+    configure_retries(retries=retries)
+    if len(facility_ids) == 1:
+        fetch_one(facility_ids[0],base_url)
+    else: # the output shape follows how ids were given, never how many stdin happened to hold 
+        fetch_batch(list(facility_ids) or sys.stdin.read().split(),base_url,batch_size)
 
 
 if __name__ == '__main__':
@@ -21,7 +21,7 @@ def main():
     if not flatten_dir_filepath.exists():
         flatten_dir_filepath.mkdir()
     list_of_inst_models = JsonReader().read(json_filepath,FakeEnergyFacilityModel) 
-    list_of_flatten_models = flatten(list_of_inst_models,FlattenFakeEnergyFacilityModel) 
+    list_of_flatten_models = flatten(list_of_inst_models,FlattenFakeEnergyFacilityModel,trusted=True) # validated by JsonReader 
     sorted_data = sort(list_of_flatten_models, 'facility_id','energy_type','timestamp','agency')
     CsvWriter().write(sorted_data,csv_filepath) 
 
@@ -12,59 +12,847 @@ essentially work in a for loop (like range).
 """
 
 
-from typing import Any, Dict, Generator, Tuple
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
+import codecs
+import hashlib
+import json
+import os
+import pathlib
+import queue
+import random
+import re
+import threading
 import requests
+import requests.adapters
 import time
 
 
-def fetch(url: str, raise_for_status: bool=True, **query_params) -> Tuple[int, Dict[str, Any]]:
+_validators = OrderedDict() # _cache_key(url, params) -> (etag, body bytes), least recently used first 
+_validators_lock = threading.Lock()
+_validators_bytes = 0 # running total of the bodies held in _validators 
+VALIDATOR_CACHE_BYTES = 32 * 1024 * 1024 # bodies kept in memory for revalidation, bigger ones are not kept 
+
+POOL_SIZE = 10 # keep-alive connections kept open per host 
+DEFAULT_HEADERS = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+
+_session = None 
+_session_lock = threading.Lock()
+
+
+def make_session(pool_size: int=POOL_SIZE, headers: Dict[str, str]=None) -> requests.Session:
+    """Builds a requests.Session whose connections are pooled and kept alive between calls. The 
+    underlying urllib3 pool is thread safe so one session can be shared by every thread doing GETs. 
+
+    Args:
+        pool_size (int, optional): Connections kept open per host. Defaults to POOL_SIZE.
+        headers (Dict[str, str], optional): Headers sent with every request on top of DEFAULT_HEADERS.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers.update(headers or {})
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the module managed session, creating it on first use."""
+    global _session 
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def configure_session(pool_size: int=POOL_SIZE, headers: Dict[str, str]=None) -> requests.Session:
+    """Replaces the module managed session, ex. to grow the pool before fetching from many threads."""
+    global _session 
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = make_session(pool_size, headers)
+        return _session
+
+
+THROTTLE_STATUS_CODES = (429, 503)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class AdaptiveRateLimiter(object):
+    """A token bucket shared by every request in the process. The rate halves on a 429 or 503, 
+    everybody pauses for the Retry-After the server asked for, and each healthy response raises the 
+    rate by `increase` requests per second again, up to max_rate. 
+
+    Args:
+        rate (float, optional): Starting requests per second. Defaults to 10.
+        burst (int, optional): Requests allowed back to back. Defaults to 10.
+        min_rate (float, optional): Floor for the rate. Defaults to 0.5.
+        max_rate (float, optional): Ceiling for the rate. Defaults to 100.
+        increase (float, optional): Added to the rate after each healthy response. Defaults to 0.5.
+        decrease (float, optional): Rate multiplier after a throttled response. Defaults to 0.5.
+    """
+
+    def __init__(self, rate: float=10.0, burst: int=10, min_rate: float=0.5, max_rate: float=100.0, increase: float=0.5, decrease: float=0.5):
+        self.rate = rate 
+        self.burst = burst 
+        self.min_rate = min_rate 
+        self.max_rate = max_rate 
+        self.increase = increase 
+        self.decrease = decrease 
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0 
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns how many seconds the caller has to wait before using it. Lets 
+        threads (acquire) and coroutines (asyncio.sleep) share one limiter."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now 
+            self._tokens -= 1 # may go negative, the debt is paid off by waiting 
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0 
+            return max(delay, self._paused_until - now)
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def observe(self, status_code: int, retry_after: Optional[str]=None) -> None:
+        """Adapts the rate to a response."""
+        with self._lock:
+            if status_code in THROTTLE_STATUS_CODES:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                pause = _retry_after_seconds(retry_after)
+                if pause:
+                    self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            elif status_code < 500:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an http date 
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass 
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiter = AdaptiveRateLimiter()
+
+
+def get_limiter() -> AdaptiveRateLimiter:
+    """Returns the process wide rate limiter."""
+    return _limiter 
+
+
+def configure_limiter(**kwargs) -> AdaptiveRateLimiter:
+    """Replaces the process wide rate limiter, kwargs are those of AdaptiveRateLimiter."""
+    global _limiter 
+    _limiter = AdaptiveRateLimiter(**kwargs)
+    return _limiter 
+
+
+class RetryPolicy(object):
+    """How often and how patiently an idempotent GET is sent again after a transient failure, a 
+    connection error, a timeout or one of `status_codes`. The n-th retry waits a random time between 0 
+    and backoff * 2**n seconds (full jitter) capped at max_backoff, so many clients that failed together 
+    do not come back together. Throttled responses wait on the rate limiter instead.
+
+    Args:
+        retries (int, optional): Times a request is sent again before giving up. Defaults to 5.
+        backoff (float, optional): Base delay in seconds. Defaults to 0.5.
+        max_backoff (float, optional): Ceiling for a single delay. Defaults to 30.
+        jitter (bool, optional): Whether to randomize the delay. Defaults to True.
+        status_codes (Tuple[int], optional): Status codes worth another attempt. Defaults to RETRY_STATUS_CODES.
+    """
+
+    def __init__(self, retries: int=5, backoff: float=0.5, max_backoff: float=30.0, jitter: bool=True, status_codes: Tuple[int, ...]=RETRY_STATUS_CODES):
+        self.retries = retries 
+        self.backoff = backoff 
+        self.max_backoff = max_backoff 
+        self.jitter = jitter 
+        self.status_codes = status_codes 
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the failed attempt number `attempt` (counting from 0)."""
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without sending anything while the circuit breaker considers the API down."""
+
+
+class CircuitBreaker(object):
+    """Fails fast once the API is clearly down. After `failure_threshold` failed attempts in a row 
+    (connection errors, timeouts and 5xx answers) the circuit opens and every request raises 
+    CircuitOpenError. After `reset_timeout` seconds a single trial request is let through, its success 
+    closes the circuit again and its failure keeps it open for another `reset_timeout`.
+
+    Args:
+        failure_threshold (int, optional): Consecutive failures that open the circuit. Defaults to 10.
+        reset_timeout (float, optional): Seconds the circuit stays open. Defaults to 30.
+    """
+
+    def __init__(self, failure_threshold: int=10, reset_timeout: float=30.0):
+        self.failure_threshold = failure_threshold 
+        self.reset_timeout = reset_timeout 
+        self.failures = 0 
+        self.state = 'closed' # closed -> open -> half_open -> closed or open 
+        self._opened_at = 0.0 
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """Raises CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            if self.state == 'closed':
+                return 
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open' # this caller is the trial request 
+                return 
+            _metrics.rejected()
+            raise CircuitOpenError(f'circuit open after {self.failures} consecutive failures')
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0 
+            self.state = 'closed'
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1 
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def abandon_trial(self) -> None:
+        """Reopens a half open circuit whose trial request ended without an answer from the API (a bad 
+        url, an interrupt). The circuit is otherwise left alone and nothing counts toward failure_threshold."""
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+METRICS_HISTORY = 1000 # attempts kept in FetchMetrics.recent 
+
+
+class FetchMetrics(object):
+    """Records every attempt made by fetch, fetch_stream and afetch: counters plus the most recent 
+    attempts as (url, attempt, status_code, error, elapsed seconds) tuples."""
+
+    def __init__(self, history: int=METRICS_HISTORY):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=history)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.recent.clear()
+            self.attempts = 0 
+            self.retries = 0 
+            self.rejected_by_circuit = 0 
+            self.elapsed = 0.0 
+            self.status_codes = Counter()
+            self.errors = Counter()
+
+    def record(self, url: str, attempt: int, status_code: Optional[int], error: Optional[str], elapsed: float) -> None:
+        with self._lock:
+            self.recent.append((url, attempt, status_code, error, elapsed))
+            self.attempts += 1 
+            self.retries += attempt > 0 
+            self.elapsed += elapsed 
+            if error is None:
+                self.status_codes[status_code] += 1 
+            else:
+                self.errors[error] += 1 
+
+    def rejected(self) -> None:
+        with self._lock:
+            self.rejected_by_circuit += 1 
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the counters as a plain dict."""
+        with self._lock:
+            return {
+                'attempts': self.attempts, 
+                'retries': self.retries, 
+                'rejected_by_circuit': self.rejected_by_circuit, 
+                'elapsed': round(self.elapsed, 3), 
+                'status_codes': dict(self.status_codes), 
+                'errors': dict(self.errors), 
+            }
+
+
+_retry_policy = RetryPolicy()
+_breaker = CircuitBreaker()
+_metrics = FetchMetrics()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Returns the process wide retry policy."""
+    return _retry_policy 
+
+
+def configure_retries(**kwargs) -> RetryPolicy:
+    """Replaces the process wide retry policy, kwargs are those of RetryPolicy. Use retries=0 to disable."""
+    global _retry_policy 
+    _retry_policy = RetryPolicy(**kwargs)
+    return _retry_policy 
+
+
+def get_breaker() -> CircuitBreaker:
+    """Returns the process wide circuit breaker."""
+    return _breaker 
+
+
+def configure_breaker(**kwargs) -> CircuitBreaker:
+    """Replaces the process wide circuit breaker, kwargs are those of CircuitBreaker."""
+    global _breaker 
+    _breaker = CircuitBreaker(**kwargs)
+    return _breaker 
+
+
+def get_metrics() -> FetchMetrics:
+    """Returns the process wide per attempt metrics."""
+    return _metrics 
+
+
+def _get(client: requests.Session, url: str, **kwargs) -> requests.Response:
+    # sends a GET through the circuit breaker and rate limiter, retrying transient failures 
+    policy, breaker, limiter = get_retry_policy(), get_breaker(), get_limiter()
+    attempt = 0 
+    while True:
+        breaker.allow()
+        started = time.monotonic()
+        try:
+            limiter.acquire()
+            started = time.monotonic()
+            res_obj = client.get(url, **kwargs)
+        except RETRY_EXCEPTIONS as exc:
+            _metrics.record(url, attempt, None, type(exc).__name__, time.monotonic() - started)
+            breaker.record_failure()
+            if attempt >= policy.retries:
+                raise 
+            time.sleep(policy.delay(attempt))
+        except BaseException as exc: # a local error, not the API failing, but a half open breaker must not wait for this trial forever 
+            _metrics.record(url, attempt, None, type(exc).__name__, time.monotonic() - started)
+            breaker.abandon_trial()
+            raise 
+        else:
+            status_code = res_obj.status_code 
+            _metrics.record(url, attempt, status_code, None, time.monotonic() - started)
+            limiter.observe(status_code, res_obj.headers.get('Retry-After'))
+            if status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if status_code not in policy.status_codes or attempt >= policy.retries:
+                return res_obj 
+            res_obj.close()
+            if status_code not in THROTTLE_STATUS_CODES: # the limiter already paces throttled retries 
+                time.sleep(policy.delay(attempt))
+        attempt += 1 
+
+
+DISK_CACHE_MAX_AGE = 300.0 # seconds an entry is used without asking the server 
+DISK_CACHE_SIZE = 256 * 2**20 # bytes 
+
+
+class DiskCache(object):
+    """An opt-in response cache on disk, shared by fetch and afetch and kept between runs. Each 200 
+    response is one file named by the sha1 of the url plus params. The file holds a json header line 
+    (key, etag, time stored) followed by the raw body. Entries younger than `max_age` are used without 
+    a request. Older ones are revalidated with If-None-Match when the server sent an etag. Sizes are 
+    tracked in memory in least recently used order (read from the directory once, on the first put), so 
+    once the entries grow past `max_size` bytes the least recently used go first. Reads also touch the 
+    file so that order carries over to the next run.
+
+    Args:
+        directory (str): Where entries are kept, created if missing.
+        max_age (float, optional): Seconds an entry is used without asking the server. Defaults to DISK_CACHE_MAX_AGE.
+        max_size (int, optional): Bytes kept on disk. Defaults to DISK_CACHE_SIZE.
+    """
+
+    def __init__(self, directory: str, max_age: float=DISK_CACHE_MAX_AGE, max_size: int=DISK_CACHE_SIZE):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age 
+        self.max_size = max_size 
+        self._lock = threading.Lock()
+        self._index = None # file name -> size, least recently used first, read from disk once 
+        self._total = 0 
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / (hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def _load_index(self) -> None:
+        # called with the lock held, the directory is listed once per instance rather then on every put 
+        entries = []
+        for path in self.directory.glob('*.cache'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue 
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        self._index = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._total = sum(self._index.values())
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], bytes, bool]]:
+        """Returns (etag, body, fresh) for a stored response, None on a miss. An unreadable entry is a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+            if header.get('key') != key:
+                return None
+            fresh = time.time() - float(header['stored']) < self.max_age 
+            os.utime(path) # marks the entry as recently used for the next run 
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        with self._lock:
+            if self._index is not None and path.name in self._index:
+                self._index.move_to_end(path.name)
+        return (header.get('etag'), body, fresh)
+
+    def put(self, key: str, etag: Optional[str], body: bytes) -> None:
+        """Stores a response, then evicts least recently used entries past max_size."""
+        path = self._path(key)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        header = json.dumps({'key': key, 'etag': etag, 'stored': time.time()}).encode() + b'\n'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(body)
+        os.replace(tmp_path, path) # readers never see half an entry 
+        with self._lock:
+            if self._index is None:
+                self._load_index() # already counts the entry just written 
+            else:
+                self._total += len(header) + len(body) - self._index.pop(path.name, 0)
+                self._index[path.name] = len(header) + len(body)
+            self._evict()
+
+    def _evict(self) -> None:
+        # called with the lock held, drops least recently used entries until the total fits 
+        while self._total > self.max_size and self._index:
+            name, size = self._index.popitem(last=False)
+            (self.directory / name).unlink(missing_ok=True)
+            self._total -= size 
+
+
+_disk_cache = None 
+
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """Returns the process wide disk cache, None unless one was configured."""
+    return _disk_cache 
+
+
+def configure_disk_cache(directory: Optional[str], **kwargs) -> Optional[DiskCache]:
+    """Turns the disk cache on for `directory`, kwargs are those of DiskCache. None turns it off."""
+    global _disk_cache 
+    _disk_cache = DiskCache(directory, **kwargs) if directory is not None else None 
+    return _disk_cache 
+
+
+def _cache_key(url: str, query_params: Dict[str, Any]) -> str:
+    return url + '?' + urlencode(sorted(query_params.items()), doseq=True)
+
+
+def fetch(url: str, raise_for_status: bool=True, client: requests.Session=None, **query_params) -> Tuple[int, Dict[str, Any]]:
     """Fetches data using the requests API from the specified url. Raises a 
     requests.HTTPError for status codes above if raise_for_status is set to True. 
+    The etag of each successful response is kept per url and sent back as If-None-Match, so when 
+    the server answers 304 Not Modified the previously downloaded body is decoded again instead and 
+    reported as a 200, the same as any other answer that carries the page. 
+    Every request waits on the process wide rate limiter first. Connection errors, timeouts and 
+    429/5xx answers are retried with backoff (see RetryPolicy) unless the CircuitBreaker is open. 
+    When a DiskCache is configured, fresh entries are returned without a request and its etags are 
+    used for revalidation, so reruns reuse pages downloaded by earlier runs.
 
     Args:
         url (str, optional): The request url.
         raise_for_status(bool, optional): Whether to raise on an error code. Defaults to True. 
+        client (requests.Session, optional): Anything with a requests style `get`. Defaults to the module session.
         **query_params (optional): Optional key word args to support to query the database.
 
     Raises:
         requests.HTTPError: if raise_for_status is set to true.
+        CircuitOpenError: if the circuit breaker is open.
 
     Returns:
         Tuple[int, Dict[str, Any]]: A tuple of status code followed by the data.
     """
     # HINT carefully read the requests documentation to figure out the cleanest way to raise a requests error.
     #query_params is a dict, **query_params is keyword arg 
-    res_obj = requests.get(url, params=query_params)
+    client = client if client is not None else get_session()
+    disk_cache, key = get_disk_cache(), _cache_key(url, query_params) # urlencoded, so list params work too 
+    stored = disk_cache.get(key) if disk_cache is not None else None 
+    if stored is not None and stored[2]:
+        return (200, json.loads(stored[1]))
+    with _validators_lock:
+        cached = _validators.get(key)
+        if cached is not None:
+            _validators.move_to_end(key) # revalidated pages are the ones worth keeping 
+    if stored is not None and stored[0]:
+        cached = stored[:2]
+    headers = {'If-None-Match': cached[0]} if cached is not None else {}
+    res_obj = _get(client, url, params=query_params, headers=headers)
+    if cached is not None and res_obj.status_code == 304: 
+        if stored is not None:
+            disk_cache.put(key, *cached) # fresh for another max_age 
+        return (200, json.loads(cached[1])) # fresh dict, callers may mutate it 
     if raise_for_status:# default to True 
         res_obj.raise_for_status()# if 200 result is None "All is well"
+    etag = res_obj.headers.get('ETag') if res_obj.status_code == 200 else None
+    if disk_cache is not None and res_obj.status_code == 200:
+        disk_cache.put(key, etag, res_obj.content)
+    if etag and len(res_obj.content) <= VALIDATOR_CACHE_BYTES: 
+        _remember(key, etag, res_obj.content)
     return (res_obj.status_code, res_obj.json()) # returns code and dict 
 
 
-def paginator(url: str, timeout: int=0.1, **kwargs) -> Generator[Tuple[int, Dict[str, Any]], None, None]: 
+def _remember(key: str, etag: str, body: bytes) -> None:
+    # keeps the body for revalidation, dropping least recently used ones past VALIDATOR_CACHE_BYTES 
+    global _validators_bytes 
+    with _validators_lock:
+        previous = _validators.pop(key, None)
+        if previous is not None:
+            _validators_bytes -= len(previous[1])
+        _validators[key] = (etag, body)
+        _validators_bytes += len(body)
+        while _validators_bytes > VALIDATOR_CACHE_BYTES: 
+            _, (_, dropped) = _validators.popitem(last=False)
+            _validators_bytes -= len(dropped)
+
+
+def fetch_stream(url: str, client: requests.Session=None, **query_params) -> Generator[Dict[str, Any], None, None]:
+    """Consumes a newline delimited json response incrementally, yielding one record per line as it 
+    arrives rather then loading the whole body. Raises a requests.HTTPError for error status codes.
+    Only the request itself is retried, a connection dropped half way through the body raises.
+
+    Args:
+        url (str): The request url of a streaming endpoint.
+        client (requests.Session, optional): Anything with a requests style `get`. Defaults to the module session.
+        **query_params (optional): Optional key word args to support to query the database.
+
+    Yields:
+        Generator[Dict[str, Any]]: Yields each record as a dictionary.
+    """
+    client = client if client is not None else get_session()
+    with _get(client, url, params=query_params, stream=True) as res_obj:
+        res_obj.raise_for_status()
+        for line in res_obj.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+STREAM_CHUNK_SIZE = 64 * 1024 # bytes read from the socket at a time by fetch_records 
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonStream(object):
+    """Just enough of an incremental json reader to walk the top level of a page: consumes text chunk 
+    by chunk and decodes one value at a time, dropping text that was already consumed."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = codecs.iterdecode(chunks, 'utf-8')
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0 
+        self._eof = False 
+
+    def _fill(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True 
+            return False 
+        self._buf = self._buf[self._pos:] + chunk 
+        self._pos = 0 
+        return True 
+
+    def next_char(self) -> str:
+        """Skips whitespace and consumes one character."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                self._pos += 1 
+                return self._buf[self._pos - 1]
+            if not self._fill():
+                raise ValueError('unexpected end of json')
+
+    def peek(self) -> str:
+        char = self.next_char()
+        self._pos -= 1 
+        return char 
+
+    def expect(self, char: str) -> None:
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f'expected {char!r} in json, found {found!r}')
+
+    def value(self) -> Any:
+        """Decodes the next complete json value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise 
+                continue 
+            if end == len(self._buf) and self._fill(): # a number may go on in the next chunk 
+                continue 
+            self._pos = end 
+            return value 
+
+
+def _decode_records(chunks: Iterator[bytes], key: str='records') -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+    # yields the elements of the top level `key` array one at a time, returns the other top level entries 
+    stream = _JsonStream(chunks)
+    page = {}
+    stream.expect('{')
+    if stream.peek() == '}':
+        return page 
+    while True:
+        name = stream.value()
+        stream.expect(':')
+        if name == key and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.next_char() == ']':
+                        break 
+        else:
+            page[name] = stream.value()
+        if stream.next_char() == '}':
+            return page 
+
+
+def fetch_records(url: str, client: requests.Session=None, **query_params) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+    """Decodes a list view page while it downloads, yielding each element of `records` as soon as it is 
+    complete. Memory is bounded by one record plus one chunk rather then the page text and the whole 
+    decoded page at once. The rest of the page (count, next, ...) is the return value of the generator, 
+    ex. `page = yield from fetch_records(url)`. Requests go through the rate limiter, retries and circuit 
+    breaker like fetch but bypass the etag and disk caches.
+
+    Args:
+        url (str): The request url of a list view.
+        client (requests.Session, optional): Anything with a requests style `get`. Defaults to the module session.
+        **query_params (optional): Optional key word args to support to query the database.
+
+    Yields:
+        Generator[Dict[str, Any]]: Yields each record as a dictionary.
+    """
+    client = client if client is not None else get_session()
+    with _get(client, url, params=query_params, stream=True) as res_obj:
+        res_obj.raise_for_status()
+        return (yield from _decode_records(res_obj.iter_content(STREAM_CHUNK_SIZE)))
+
+
+def paginate_records(url: str, client: requests.Session=None, **kwargs) -> Generator[Dict[str, Any], None, None]:
+    """The per record version of `paginator`: follows `next` like it does but decodes every page with 
+    fetch_records, yielding one record at a time.
+
+    Args:
+        url (str): The url.
+        client (requests.Session, optional): Forwarded to fetch_records. Defaults to the module session.
+        **kwargs (optional): Optional keyword args that get forwarded as query params.
+
+    Yields:
+        Generator[Dict[str, Any]]: Yields each record as a dictionary.
+    """
+    while True:
+        page = yield from fetch_records(url, client=client, **kwargs)
+        next_url = page.get('next')
+        if next_url is None:
+            break 
+        url = next_url 
+        kwargs = _params_not_in(url, kwargs)
+
+
+def paginator(url: str, timeout: float=None, client: requests.Session=None, workers: int=1, prefetch: int=0, **kwargs) -> Generator[Tuple[int, Dict[str, Any]], None, None]: 
     """A simple paginator that will iterate through all the data in our API list view. It will yield a new chunk of 
-    data from the API each iteration. After each call the thread will `sleep` for a short amount of time. This is 
+    data from the API each iteration. Requests are paced by the process wide AdaptiveRateLimiter (see fetch). This is 
     an important feature to working with APIs as many will throttle you if you hit it with too many requests in too short an 
-    amount of time.
+    amount of time. A fixed `timeout` sleep between pages can still be asked for on top of it.
     As mentioned above this should be implemented as a generator.
     ex. 
     >>> for status, data in paginator(url, timeout=0.25, foo=bar, baz=bip):
             print(status, data) # <-- this yields one status, page using the filter **params
+    The paginator simply follows `next`, so numbered pages and cursor pages (start with `cursor=''`) both 
+    work. Params the `next` url already carries are not sent a second time.
+    With workers > 1 the page count reported with page 1 is used to fetch the remaining numbered pages 
+    through a thread pool. Pages are still yielded in order and `timeout` is still a pause before each page 
+    request is handed to the pool, so requests start at least `timeout` apart. Cursor pages are always followed 
+    one by one.
+    With prefetch > 0 a background thread reads up to `prefetch` pages ahead of the consumer, so waiting on the 
+    network overlaps with whatever the consumer does with each page. The thread goes through fetch, so the rate 
+    limiter, retries and `timeout` still apply, and an exception it hits is raised in the consumer.
     Args:
         url (str, optional): The url.
-        timeout (int, optional): A timeout parameter in between paginating calls. 
+        timeout (float, optional): A fixed pause in between paginating calls. Defaults to None, no pause. 
+        client (requests.Session, optional): Forwarded to fetch. Defaults to the module session.
+        workers (int, optional): Number of pages fetched concurrently. Defaults to 1.
+        prefetch (int, optional): Pages read ahead by a background thread. Defaults to 0, no read ahead.
         **kwargs (optional): Optional keyword args that get forwarded to requests.
     Yields:
         Generator[Tuple[int, Dict[str, Any]]]: Yields a tuple of status code and dictionary.
     """
+    if prefetch > 0:
+        yield from _read_ahead(paginator(url, timeout, client, workers, **kwargs), prefetch)
+        return
+    if workers > 1:
+        yield from _concurrent_paginator(url, timeout, client, workers, kwargs)
+        return
     while True:
-        status, data = fetch(url, **kwargs) 
+        status, data = fetch(url, client=client, **kwargs) 
         yield status, data 
         next_url = data['next']
         if next_url is None: 
             break 
         else:
             url = next_url         
-        time.sleep(timeout)
+            kwargs = _params_not_in(url, kwargs)
+        if timeout:
+            time.sleep(timeout)
+
+
+def _concurrent_paginator(url: str, timeout: Optional[float], client: requests.Session, workers: int, params: Dict[str, Any]) -> Generator[Tuple[int, Dict[str, Any]], None, None]:
+    status, data = fetch(url, client=client, **params)
+    yield status, data 
+    next_url = data['next']
+    if next_url is None:
+        return 
+    params = _params_not_in(next_url, params)
+    page_urls = _page_urls(next_url, data['count'], len(data['records']))
+    if page_urls is None: # a cursor, there is no way to know page k's url up front 
+        if timeout:
+            time.sleep(timeout)
+        yield from paginator(next_url, timeout, client, **params)
+        return 
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    page_urls = iter(page_urls)
+    pending = deque() # at most workers * 2 pages in flight, a slow consumer does not pull in the whole listing 
+
+    def submit(page_url):
+        if timeout: # the same pause before each page request as the sequential paginator 
+            time.sleep(timeout)
+        pending.append(pool.submit(fetch, page_url, client=client, **params))
+
+    try:
+        for page_url in page_urls:
+            submit(page_url)
+            if len(pending) >= workers * 2:
+                break 
+        while pending:
+            result = pending.popleft().result()
+            for page_url in page_urls: # top up before handing the page over 
+                submit(page_url)
+                break 
+            yield result 
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True) # the consumer may stop early 
+
+
+_END = object() # marks the end of the pages in _read_ahead's queue 
+
+
+def _read_ahead(pages: Generator[Any, None, None], depth: int) -> Generator[Any, None, None]:
+    # drives `pages` from a background thread through a queue of at most `depth` items 
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def offer(item, error=None):
+        while not stop.is_set(): # the consumer may be gone, never block on a full queue for good 
+            try:
+                buffer.put((item, error), timeout=0.1)
+                return True 
+            except queue.Full:
+                continue 
+        return False 
+
+    def produce():
+        try:
+            for page in pages:
+                if not offer(page):
+                    return 
+            offer(_END)
+        except BaseException as exc: # surfaced in the consumer 
+            offer(_END, exc)
+        finally:
+            pages.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            page, error = buffer.get()
+            if error is not None:
+                raise error 
+            if page is _END:
+                return 
+            yield page 
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _page_urls(next_url: str, count: int, page_size: int) -> Optional[List[str]]:
+    ''' builds the urls of pages 2..n from the url of page 2 
+        Args:
+            next_url: the `next` url of page 1 
+            count: total number of records reported by the server 
+            page_size: number of records on page 1 
+        Returns:
+            list of urls, None if next_url is not a numbered page 
+    '''
+    parts = urlsplit(next_url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if not page_size or 'page' not in dict(query):
+        return None
+    num_pages = -(-count // page_size)
+    urls = []
+    for page_num in range(2, num_pages + 1):
+        page_query = [(key, str(page_num) if key == 'page' else value) for key, value in query]
+        urls.append(urlunsplit(parts._replace(query=urlencode(page_query))))
+    return urls
+
+
+def _params_not_in(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    ''' drops the params a url already carries so following a `next` link never repeats a query arg 
+        Args:
+            url: a url, possibly with a query string 
+            params: query params 
+        Returns:
+            the params missing from the url 
+    '''
+    present = parse_qs(urlsplit(url).query, keep_blank_values=True)
+    return {key: value for key, value in params.items() if key not in present}
 '''  
     old solution:
         status, data = fetch(url, **kwargs) 
@@ -9,10 +9,10 @@ This application should take:
 '''
 
 import os 
-import copy 
 import click 
 import pathlib
-from utils_data_manipulation import fetch_data, summarize, pydantic_converter_of, flatten, list_of_agencies_in, sort, categorize
+from utils_data_manipulation import fetch_data, pydantic_converter_of, flatten, list_of_agencies_in, sort, categorize
+from http_file import DISK_CACHE_MAX_AGE, configure_disk_cache
 from utils_IO_bound import summary_splitter
 from schemas import SummaryFakeEnergyFacilityModel, FlattenSummaryFakeEnergyFacilityModel
 
@@ -20,12 +20,11 @@ this_dir = os.path.dirname(os.path.realpath(__file__))
 
 
 def portfolio(agency, base_url, directory, file_type):
-    url = base_url + '/data/'
+    url = base_url + '/data/summary' # summaries are computed server side 
     if not os.path.isdir(directory):
         return click.echo('The following directory does not exist, please refer to the help document for more information')
     directory_path = pathlib.Path(directory)
-    dataset = fetch_data(url,agency=agency)
-    summarized_dataset = summarize(copy.deepcopy(dataset))
+    summarized_dataset = fetch_data(url,agency=agency)
     list_of_summary_models = pydantic_converter_of(summarized_dataset, SummaryFakeEnergyFacilityModel)
     list_of_flatten_models = flatten(list_of_summary_models, FlattenSummaryFakeEnergyFacilityModel)
     list_of_agencies = list_of_agencies_in(list_of_summary_models)
@@ -45,8 +44,12 @@ url = 'http://localhost:8080'
 @click.option('--base_url', '-url', default=url, help='URL address to API')  
 @click.option('--directory', '-dir', default=this_dir, help='directory path. For nested directory please specify the path. Example dir_A/sub_dir_a01')  
 @click.option('--file_type', '-f', default='json', help='json or csv')  
-def main(agency, base_url, directory, file_type):
+@click.option('--cache-dir', default=None, help='directory for an on-disk cache of API responses, off by default')  
+@click.option('--max-age', default=DISK_CACHE_MAX_AGE, help='seconds a cached API response is used without asking the server')  
+def main(agency, base_url, directory, file_type, cache_dir, max_age):
     ''' A CLI that fetches via API call, a portfolio summary record a given agency. The portfolio output can be either json or csv with default to json'''
+    if cache_dir:
+        configure_disk_cache(cache_dir, max_age=max_age)
     portfolio(agency, base_url, directory, file_type)
 
 
@@ -23,10 +23,11 @@ For each agency write both a json file and csv with the format `<agency>-summary
 
 
 import os 
-import copy 
+import click 
 import pathlib 
 from schemas import SummaryFakeEnergyFacilityModel, FlattenSummaryFakeEnergyFacilityModel
-from utils_data_manipulation import fetch_data, summarize, pydantic_converter_of, flatten, sort, list_of_agencies_in, categorize
+from utils_data_manipulation import fetch_data, pydantic_converter_of, flatten, sort, list_of_agencies_in, categorize
+from http_file import DISK_CACHE_MAX_AGE, configure_disk_cache
 from utils_IO_bound import summary_splitter
 
 
@@ -35,12 +36,17 @@ this_dir = os.path.dirname(os.path.realpath(__file__))
 summary_dir_filepath = pathlib.Path(this_dir) / 'project_data' / 'summary'
 
 
-def main():
-    url = 'http://localhost:8080' + '/data/'
-    original_dataset = fetch_data(url)
-    summarized_dataset = summarize(copy.deepcopy(original_dataset))
+@click.command()  
+@click.option('--cache-dir', default=None, help='directory for an on-disk cache of API responses, off by default')  
+@click.option('--max-age', default=DISK_CACHE_MAX_AGE, help='seconds a cached API response is used without asking the server')  
+def main(cache_dir, max_age):
+    ''' A CLI that writes the per agency energy summaries, optionally caching API responses on disk '''
+    if cache_dir:
+        configure_disk_cache(cache_dir, max_age=max_age)
+    url = 'http://localhost:8080' + '/data/summary' # summaries are computed server side 
+    summarized_dataset = fetch_data(url, page_size=500)
     list_of_summary_models = pydantic_converter_of(summarized_dataset,SummaryFakeEnergyFacilityModel)
-    list_of_flatten_models = flatten(copy.deepcopy(list_of_summary_models), FlattenSummaryFakeEnergyFacilityModel)
+    list_of_flatten_models = flatten(list_of_summary_models, FlattenSummaryFakeEnergyFacilityModel)
     list_of_sorted_sum_data = sort(list_of_summary_models, 'facility_id')
     list_of_sorted_flat_data = sort(list_of_flatten_models, 'facility_id', 'energy_type', 'year')
     list_of_agencies = list_of_agencies_in(list_of_summary_models)
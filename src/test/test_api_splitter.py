@@ -2,7 +2,8 @@ import json
 import pytest 
 import requests 
 import requests_mock 
-from module_two.utils_data_manipulation import fetch_data 
+from unittest import mock
+from module_two.utils_data_manipulation import fetch_data, fetch_by_ids, fetch_many_queries, iter_records
 
 
 def test_fetch_data():
@@ -34,3 +35,52 @@ def test_fetch_data_with_kwarg():
         mocker.get(url + '?sqft_gte=100', json=json_resp)
         dataset = fetch_data('http://example.com', sqft_gte=100)
         assert dataset == [{'sqft': 100, 'total_usgae': 2000 },{'sqft': 100, 'total_usgae': 4000 }]
+
+
+def test_fetch_by_ids():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://example.com'
+        mocker.get(url + '/data/batch?ids=1,2', json={'count': 2, 'missing': [], 'records': [{'_id': 'a', 'facility_id': 1}, {'_id': 'b', 'facility_id': 2}]})
+        mocker.get(url + '/data/batch?ids=3', json={'count': 0, 'missing': [3], 'records': []})
+        dataset = fetch_by_ids(url, [1, 2, 3], batch_size=2)
+        assert dataset == [{'facility_id': 1}, {'facility_id': 2}]
+        assert mocker.call_count == 2
+
+
+def test_fetch_data_stream():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://example.com/data/stream'
+        mocker.get(url + '?sqft_gte=100', text='{"_id": "123", "sqft": 100}\n{"_id": "345", "sqft": 200}\n')
+        dataset = fetch_data(url, stream=True, sqft_gte=100)
+        assert dataset == [{'sqft': 100}, {'sqft': 200}]
+
+
+def test_fetch_data_with_fields():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://example.com'
+        json_resp = {'count': 1, 'next': None, 'prev': None, 'records': [{'sqft': 100}]}
+        mocker.get(url + '?fields=sqft,energy_records.usage', json=json_resp)
+        dataset = fetch_data(url, fields=['sqft', 'energy_records.usage'])
+        assert dataset == [{'sqft': 100}]
+        assert mocker.last_request.qs['fields'] == ['sqft,energy_records.usage']
+
+
+def test_fetch_many_queries_drops_duplicates_and_tags():
+    list_of_datasets = [
+        [{'facility_id': 1, 'address': 'NY'}, {'facility_id': 2, 'address': 'NY, NJ'}],
+        [{'facility_id': 2, 'address': 'NY, NJ'}, {'facility_id': 3, 'address': 'NJ'}],
+    ]
+    with mock.patch('module_two.utils_data_manipulation.fetch_data_concurrently', return_value=list_of_datasets) as mock_fetch:
+        dataset = fetch_many_queries('http://example.com', {'NY': {'address_contains': 'NY'}, 'NJ': {'address_contains': 'NJ'}}, tag='states')
+        assert mock_fetch.call_args[0][1] == [{'address_contains': 'NY'}, {'address_contains': 'NJ'}]
+    assert [(data_obj['facility_id'], data_obj['states']) for data_obj in dataset] == [(1, ['NY']), (2, ['NY', 'NJ']), (3, ['NJ'])]
+
+
+def test_iter_records_stops_at_limit():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://example.com'
+        mocker.get(url + '?sqft_gte=100', json={'count': 4, 'next': url + '?sqft_gte=100&page=2', 'records': [{'_id': 'a', 'sqft': 100}, {'_id': 'b', 'sqft': 200}]})
+        mocker.get(url + '?sqft_gte=100&page=2', json={'count': 4, 'next': None, 'records': [{'_id': 'c', 'sqft': 300}, {'_id': 'd', 'sqft': 400}]})
+        assert list(iter_records(url, limit=2, sqft_gte=100)) == [{'sqft': 100}, {'sqft': 200}]
+        assert mocker.call_count == 1
+        assert list(iter_records(url, sqft_gte=100)) == [{'sqft': 100}, {'sqft': 200}, {'sqft': 300}, {'sqft': 400}]
@@ -0,0 +1,105 @@
+""" Tests for the `async_http_file` module 
+"""
+
+import asyncio
+import contextlib
+import time
+from unittest import mock
+from aiohttp import web
+from module_two.async_http_file import AsyncClient, AsyncRateLimiter, afetch, apaginator
+from module_two.http_file import AdaptiveRateLimiter, CircuitBreaker, RetryPolicy
+
+
+def test_apaginator_breaks_on_none():
+    responses = [
+        (200, {'next': 'url1?page=2'}), 
+        (200, {'next': 'url1?page=3'}), 
+        (200, {'next': None})
+    ]
+    async def collect():
+        return [status async for status, _ in apaginator('http://localhost:8080', client=None, timeout=0, agency='A')]
+    with mock.patch('module_two.async_http_file.afetch', side_effect=responses) as mock_req:
+        assert asyncio.run(collect()) == [200, 200, 200]
+        assert mock_req.call_count == 3 
+        assert mock_req.call_args_list[1] == mock.call('url1?page=2', None, agency='A')
+
+
+def test_AsyncRateLimiter_spaces_requests():
+    async def three_waits():
+        limiter = AsyncRateLimiter(0.05)
+        start = time.monotonic()
+        await asyncio.gather(limiter.wait(), limiter.wait(), limiter.wait())
+        return time.monotonic() - start
+    assert asyncio.run(three_waits()) >= 0.1
+
+
+@contextlib.asynccontextmanager
+async def fake_api(handler):
+    # serves `handler` on a free local port, yields the url of /data/ 
+    app = web.Application()
+    app.router.add_get('/data/', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    try:
+        host, port = runner.addresses[0][:2]
+        yield f'http://{host}:{port}/data/'
+    finally:
+        await runner.cleanup()
+
+
+@contextlib.contextmanager
+def fresh_policies():
+    # afetch shares http_file's process wide policies, give each test its own 
+    with mock.patch('module_two.async_http_file.get_retry_policy', return_value=RetryPolicy(retries=2, backoff=0)), \
+            mock.patch('module_two.async_http_file.get_breaker', return_value=CircuitBreaker()), \
+            mock.patch('module_two.async_http_file.get_limiter', return_value=AdaptiveRateLimiter()):
+        yield 
+
+
+def test_afetch_retries_a_throttled_request():
+    calls = []
+    async def handler(request):
+        calls.append(request.query.get('agency'))
+        if len(calls) == 1:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        return web.json_response({'next': None, 'records': [{'facility_id': 1}]})
+    async def run():
+        async with fake_api(handler) as url, AsyncClient() as client:
+            return await afetch(url, client, agency='A')
+    with fresh_policies():
+        assert asyncio.run(run()) == (200, {'next': None, 'records': [{'facility_id': 1}]})
+    assert calls == ['A', 'A']
+
+
+def test_afetch_retries_a_dropped_connection():
+    calls = []
+    async def handler(request):
+        calls.append(1)
+        if len(calls) == 1:
+            request.transport.close() # the client sees the server disconnect 
+            raise ConnectionResetError()
+        return web.json_response({'next': None, 'records': []})
+    async def run():
+        async with fake_api(handler) as url, AsyncClient() as client:
+            return await afetch(url, client)
+    with fresh_policies():
+        assert asyncio.run(run()) == (200, {'next': None, 'records': []})
+    assert len(calls) == 2
+
+
+def test_afetch_bounds_requests_in_flight():
+    in_flight, peak = 0, 0
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return web.json_response({'next': None, 'records': []})
+    async def run():
+        async with fake_api(handler) as url, AsyncClient(max_in_flight=2) as client:
+            return await asyncio.gather(*(afetch(url, client, page=page) for page in range(6)))
+    with fresh_policies():
+        assert [status for status, _ in asyncio.run(run())] == [200] * 6
+    assert peak == 2
@@ -1,6 +1,9 @@
 import os 
 import pytest 
 import pathlib
+import json
+import requests
+from unittest import mock
 from click.testing import CliRunner
 from module_two.fetch_many import main
 parent_path = os.path.dirname(os.getcwd())  
@@ -21,4 +24,14 @@ def test_(fetch_many_output):
     result = runner.invoke(main, ['-kw',keyword])
     assert result.output == fetch_many_output
     file_path = pathlib.Path(parent_path) / 'module_two' / 'project_data' / 'result.json'
-    os.remove(file_path)
\ No newline at end of file
+    os.remove(file_path)
+
+def test_failure_mid_stream_keeps_stdout_valid_json():
+    def records(*args, **kwargs):
+        yield {'facility_id': 1, 'name': 'a', 'address': 'b', 'longitude': 1.0, 'latitude': 2.0, 'agency': 'A', 'sqft': 10, 'energy_records': []}
+        raise requests.HTTPError('500 Server Error') # ex. page 2 failed
+    with mock.patch('module_two.fetch_many.iter_records', side_effect=records):
+        result = CliRunner().invoke(main, ['--retries', '0'])
+    assert result.exit_code == 1
+    assert [data_obj['facility_id'] for data_obj in json.loads(result.stdout)] == [1]
+    assert 'http error' in result.stderr
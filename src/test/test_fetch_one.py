@@ -1,6 +1,8 @@
+import json
 import os 
 import pytest 
 from click.testing import CliRunner
+from unittest import mock
 from module_two.fetch_one import main
 import pathlib
 parent_path = os.path.dirname(os.getcwd())  
@@ -22,4 +24,12 @@ def test_(fetch_one_output):
     result = runner.invoke(main,['0'])
     file_path = pathlib.Path(parent_path) / 'module_two' / 'project_data' / 'facility_0.json'
     assert result.output == fetch_one_output
-    os.remove(file_path)
\ No newline at end of file
+    os.remove(file_path)
+
+def test_ids_from_stdin_always_print_a_list():
+    runner = CliRunner()
+    record = {'facility_id': 1, 'name': 'Building 1', 'address': '1 Main Street, Town, NY, 1', 'latitude': 0.0, 'longitude': 0.0, 'agency': 'A', 'sqft': 100, 'energy_records': []}
+    with mock.patch('module_two.fetch_one.fetch_by_ids', return_value=[record]) as fetch_by_ids:
+        result = runner.invoke(main, [], input='1\n')
+        assert fetch_by_ids.call_args[0][1] == ['1']
+    assert [rec['facility_id'] for rec in json.loads(result.output)] == [1]
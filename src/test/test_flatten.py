@@ -1,6 +1,7 @@
+import warnings
 import pytest 
 from unittest import mock 
-from module_two.utils_data_manipulation import flatten
+from module_two.utils_data_manipulation import compile_flattener, flatten, iter_flatten
 from module_two.schemas import FlattenFakeEnergyFacilityModel
 
 
@@ -12,3 +13,31 @@ def test_flatten_inst_is_pydantic(list_of_inst_models):
     result = flatten(list_of_inst_models, FlattenFakeEnergyFacilityModel)
     for obj in result:
         assert isinstance(obj, FlattenFakeEnergyFacilityModel)
+
+
+def test_flatten_trusted_matches_validated(list_of_inst_models, list_of_flat_models):
+    assert flatten(list_of_inst_models, FlattenFakeEnergyFacilityModel, trusted=True) == list_of_flat_models
+
+
+def test_iter_flatten_is_lazy(list_of_inst_models, list_of_flat_models):
+    consumed = []
+    def models():
+        for model_obj in list_of_inst_models:
+            consumed.append(model_obj)
+            yield model_obj
+    rows = iter_flatten(models(), FlattenFakeEnergyFacilityModel)
+    assert next(rows) == list_of_flat_models[0]
+    assert len(consumed) == 1
+    assert [list_of_flat_models[0]] + list(rows) == list_of_flat_models
+
+
+def test_compile_flattener_is_compiled_once(list_of_inst_models):
+    source = type(list_of_inst_models[0])
+    assert compile_flattener(source, FlattenFakeEnergyFacilityModel) is compile_flattener(source, FlattenFakeEnergyFacilityModel)
+
+
+def test_flatten_trusted_emits_no_deprecation_warnings(list_of_inst_models):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        flatten(list_of_inst_models, FlattenFakeEnergyFacilityModel, trusted=True)
+    assert not [warning for warning in caught if issubclass(warning.category, DeprecationWarning)]
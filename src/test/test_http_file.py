@@ -2,12 +2,14 @@
 """
 
 from typing import Generator
+import pathlib
 import requests
 import pytest  
 import requests 
 import requests_mock 
 from unittest import mock
-from module_two.http_file import fetch, paginator
+import time
+from module_two.http_file import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, DiskCache, configure_breaker, configure_disk_cache, configure_retries, fetch, fetch_records, fetch_stream, get_metrics, make_session, paginate_records, paginator
 
 
 def test_fetch(mock_api_resp):
@@ -30,14 +32,82 @@ def test_fetch_by_(mock_api_query_resp):
         assert resp_obj.json()['records'] == fetch_resp[1]['records']
         
 
+def test_fetch_stream():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://localhost:8080/data/stream?agency=A'
+        mocker.get(url, text='{"facility_id": 1}\n{"facility_id": 2}\n')
+        assert list(fetch_stream(url)) == [{'facility_id': 1}, {'facility_id': 2}]
+        
+
+def test_fetch_reuses_body_on_304():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://localhost:8080/data/?agency=B'
+        mocker.get(url, [
+            {'json': {'next': None, 'records': [{'facility_id': 1}]}, 'headers': {'ETag': '"abc"'}}, 
+            {'status_code': 304, 'headers': {'ETag': '"abc"'}}
+        ])
+        first = fetch(url)
+        second = fetch(url)
+        assert mocker.last_request.headers['If-None-Match'] == '"abc"'
+        assert second == (200, first[1]) # the cached body is served like any other page
+
+
+def test_fetch_caps_validator_bytes():
+    with requests_mock.Mocker() as mocker, mock.patch('module_two.http_file.VALIDATOR_CACHE_BYTES', 100):
+        for agency in 'GH':
+            mocker.get(f'http://localhost:8080/data/?agency={agency}', json={'next': None, 'records': ['x' * 30]}, headers={'ETag': f'"{agency}"'})
+        fetch('http://localhost:8080/data/?agency=G')
+        fetch('http://localhost:8080/data/?agency=H')
+        fetch('http://localhost:8080/data/?agency=G')
+        assert 'If-None-Match' not in mocker.last_request.headers # the first body was dropped to make room
+        
+
+def test_fetch_sends_list_params_and_keeps_revalidated_pages():
+    with requests_mock.Mocker() as mocker, mock.patch('module_two.http_file.VALIDATOR_CACHE_BYTES', 150):
+        url = 'http://localhost:8080/data/'
+        for agency in 'JKL':
+            mocker.get(f'{url}?agency={agency}', [
+                {'json': {'next': None, 'records': ['x' * 30]}, 'headers': {'ETag': f'"{agency}"'}}, 
+                {'status_code': 304, 'headers': {'ETag': f'"{agency}"'}}
+            ])
+        mocker.get(f'{url}?agency=A&agency=B', json={'next': None, 'records': []})
+        assert fetch(url, agency=['A', 'B']) == (200, {'next': None, 'records': []})
+        fetch(url, agency='J')
+        fetch(url, agency='K')
+        fetch(url, agency='J') # revalidated, J is now the most recently used
+        fetch(url, agency='L') # no room for three, K goes
+        assert fetch(url, agency='J')[0] == 200
+        assert mocker.last_request.headers['If-None-Match'] == '"J"'
+
+
+def test_fetch_retries_throttled_requests():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://localhost:8080/data/?agency=C'
+        mocker.get(url, [
+            {'status_code': 429, 'headers': {'Retry-After': '0'}},
+            {'json': {'next': None, 'records': []}}
+        ])
+        assert fetch(url) == (200, {'next': None, 'records': []})
+        assert mocker.call_count == 2
+
+
 def test_fetch_404(): 
     mock_response = mock.Mock(status_code=404) # mocking the response  
-    mock_request_get = mock.Mock(return_value=mock_response) #mocking api call
-    requests.get = mock_request_get # assigning this to be mock
+    mock_client = mock.Mock() # mocking the session 
+    mock_client.get.return_value = mock_response 
     url = 'http://localhost:8080/abc'
     result = (mock_response.status_code, mock_response.json() )
     print( 'mock_response.json()',mock_response.json() )
-    assert fetch(url) == result
+    assert fetch(url, client=mock_client) == result
+    assert mock_client.get.call_count == 1
+
+
+def test_make_session():
+    session = make_session(pool_size=3, headers={'X-Team': 'energy'})
+    adapter = session.get_adapter('http://localhost:8080')
+    assert adapter._pool_maxsize == 3 
+    assert session.headers['X-Team'] == 'energy'
+    assert session.headers['Connection'] == 'keep-alive'
 
 
 
@@ -59,4 +129,215 @@ def test_paginator_breaks_on_none():
     with mock.patch('module_two.http_file.fetch', side_effect=responses) as mock_req:
         for status, _ in paginator(url):
             assert status == 200 
-        assert mock_req.call_count == 3
\ No newline at end of file
+        assert mock_req.call_count == 3
+
+def test_paginator_follows_cursor_without_repeating_params():
+    responses = [
+        (200, {'next': 'http://localhost:8080/data/?cursor=MTE%3D&agency=A'}), 
+        (200, {'next': None})
+    ]
+    url = 'http://localhost:8080/data/'
+    with mock.patch('module_two.http_file.fetch', side_effect=responses) as mock_req:
+        list(paginator(url, timeout=0, cursor='', agency='A', page_size=5))
+        assert mock_req.call_args_list[0] == mock.call(url, client=None, cursor='', agency='A', page_size=5)
+        assert mock_req.call_args_list[1] == mock.call(responses[0][1]['next'], client=None, page_size=5)
+
+
+def test_paginator_prefetches_in_background():
+    responses = [
+        (200, {'next': 'url1'}),
+        (200, {'next': 'url2'}),
+        requests.HTTPError('502 Server Error'),
+    ]
+    with mock.patch('module_two.http_file.fetch', side_effect=responses) as mock_req:
+        pages = paginator('http://localhost:8080', prefetch=2)
+        assert next(pages) == responses[0]
+        time.sleep(0.05)
+        assert mock_req.call_count == 3 # read ahead while the consumer was busy
+        assert next(pages) == responses[1]
+        with pytest.raises(requests.HTTPError):
+            next(pages)
+
+
+def test_paginator_fans_out_pages_in_order():
+    url = 'http://localhost:8080/data/'
+    def pages(page_url, client=None, **params):
+        page_num = int(page_url.split('page=')[1].split('&')[0]) if 'page=' in page_url else 1
+        next_url = f'{url}?page={page_num + 1}&agency=A' if page_num < 4 else None
+        return 200, {'next': next_url, 'count': 7, 'records': [page_num] * (2 if page_num < 4 else 1)}
+    with mock.patch('module_two.http_file.fetch', side_effect=pages) as mock_req:
+        result = [data['records'] for _, data in paginator(url, timeout=0, workers=3, agency='A')]
+        assert result == [[1, 1], [2, 2], [3, 3], [4]]
+        assert mock_req.call_count == 4
+        assert mock_req.call_args_list[0] == mock.call(url, client=None, agency='A')
+
+
+def test_paginator_bounds_pages_in_flight():
+    url = 'http://localhost:8080/data/'
+    def pages(page_url, client=None, **params):
+        page_num = int(page_url.split('page=')[1]) if 'page=' in page_url else 1
+        next_url = f'{url}?page={page_num + 1}' if page_num < 50 else None
+        return 200, {'next': next_url, 'count': 100, 'records': [page_num] * 2}
+    with mock.patch('module_two.http_file.fetch', side_effect=pages) as mock_req:
+        result = paginator(url, workers=2)
+        next(result)
+        next(result)
+        time.sleep(0.05)
+        assert mock_req.call_count <= 1 + 2 * 2 + 1 # page 1, the window and one top up 
+        assert len(list(result)) == 48
+
+
+def test_AdaptiveRateLimiter_backs_off_and_recovers():
+    limiter = AdaptiveRateLimiter(rate=8, burst=1, min_rate=1, max_rate=10, increase=1)
+    limiter.observe(429, '2')
+    assert limiter.rate == 4
+    assert limiter.reserve() > 1.5 # paused for Retry-After
+    limiter.observe(200)
+    assert limiter.rate == 5
+
+
+def test_fetch_retries_server_errors_with_backoff():
+    configure_retries(retries=2, backoff=0)
+    try:
+        with requests_mock.Mocker() as mocker:
+            url = 'http://localhost:8080/data/?agency=D'
+            mocker.get(url, [
+                {'exc': requests.ConnectionError},
+                {'status_code': 502},
+                {'json': {'next': None, 'records': []}}
+            ])
+            assert fetch(url) == (200, {'next': None, 'records': []})
+            assert mocker.call_count == 3
+            assert [attempt[1:4] for attempt in list(get_metrics().recent)[-3:]] == [
+                (0, None, 'ConnectionError'), (1, 502, None), (2, 200, None)
+            ]
+    finally:
+        configure_retries()
+
+
+def test_CircuitBreaker_fails_fast_then_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    time.sleep(0.05)
+    breaker.allow() # the trial request
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+
+
+def test_fetch_uses_disk_cache(tmp_path):
+    cache = configure_disk_cache(str(tmp_path), max_age=60)
+    try:
+        with requests_mock.Mocker() as mocker:
+            url = 'http://localhost:8080/data/?agency=E'
+            mocker.get(url, [
+                {'json': {'next': None, 'records': [{'facility_id': 1}]}, 'headers': {'ETag': '"e1"'}},
+                {'status_code': 304, 'headers': {'ETag': '"e1"'}}
+            ])
+            first = fetch(url)
+            assert fetch(url) == (200, first[1]) # fresh, no request
+            assert mocker.call_count == 1
+            cache.max_age = 0
+            assert fetch(url) == (200, first[1]) # stale, revalidated with a 304
+            assert mocker.last_request.headers['If-None-Match'] == '"e1"'
+    finally:
+        configure_disk_cache(None)
+
+
+def test_DiskCache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=400) # room for two entries and their header lines
+    cache.put('a', None, b'x' * 100)
+    time.sleep(0.01)
+    cache.put('b', None, b'x' * 100)
+    time.sleep(0.01)
+    assert cache.get('a')[1] == b'x' * 100 # 'a' is now the most recently used
+    cache.put('c', None, b'x' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_DiskCache_counts_entries_from_earlier_runs(tmp_path):
+    earlier = DiskCache(str(tmp_path))
+    earlier.put('a', None, b'x' * 100)
+    time.sleep(0.01)
+    earlier.put('b', None, b'x' * 100)
+    cache = DiskCache(str(tmp_path), max_size=400)
+    with mock.patch.object(pathlib.Path, 'glob', side_effect=pathlib.Path.glob, autospec=True) as listing:
+        cache.put('c', None, b'x' * 100)
+        cache.put('d', None, b'x' * 100)
+        assert listing.call_count == 1 # the directory is listed once, not on every put
+    assert cache.get('a') is None and cache.get('b') is None
+    assert cache.get('c') is not None and cache.get('d') is not None
+
+
+def test_DiskCache_treats_a_bad_entry_as_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put('a', None, b'{}')
+    cache._path('a').write_bytes(b'{"key": "a"}\n{}') # no time stored
+    assert cache.get('a') is None
+    cache._path('a').write_bytes(b'[]\n{}')
+    assert cache.get('a') is None
+
+
+def test_paginate_records_yields_one_record_at_a_time():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://localhost:8080/data/'
+        mocker.get(url + '?agency=F', text='{"count": 3, "next": "http://localhost:8080/data/?agency=F&page=2", "records": [{"facility_id": 1}, {"facility_id": 2}]}')
+        mocker.get(url + '?agency=F&page=2', text='{"count": 3, "next": null, "records": [ {"facility_id": 3} ]}')
+        records = paginate_records(url, agency='F')
+        assert next(records) == {'facility_id': 1}
+        assert mocker.call_count == 1
+        assert list(records) == [{'facility_id': 2}, {'facility_id': 3}]
+        assert mocker.last_request.qs == {'agency': ['f'], 'page': ['2']}
+
+
+def test_fetch_records_decodes_across_chunks():
+    with requests_mock.Mocker() as mocker:
+        url = 'http://localhost:8080/data/?agency=G'
+        mocker.get(url, text='{"count": 2, "records": [{"usage": 12.5}, {"usage": [1, 2]}], "next": null}')
+        with mock.patch('module_two.http_file.STREAM_CHUNK_SIZE', 3):
+            records = fetch_records(url)
+            assert next(records) == {'usage': 12.5}
+            assert next(records) == {'usage': [1, 2]}
+            with pytest.raises(StopIteration) as stop:
+                next(records)
+    assert stop.value.value == {'count': 2, 'next': None}
+
+
+def test_CircuitBreaker_reopens_when_the_trial_request_raises():
+    breaker = configure_breaker(failure_threshold=1, reset_timeout=0)
+    configure_retries(retries=0)
+    try:
+        with requests_mock.Mocker() as mocker:
+            url = 'http://localhost:8080/data/?agency=H'
+            mocker.get(url, [
+                {'exc': requests.ConnectionError},
+                {'exc': requests.exceptions.InvalidHeader},
+                {'json': {'next': None, 'records': []}}
+            ])
+            with pytest.raises(requests.ConnectionError):
+                fetch(url)
+            with pytest.raises(requests.exceptions.InvalidHeader):
+                fetch(url) # the half open trial
+            assert breaker.state == 'open'
+            assert fetch(url) == (200, {'next': None, 'records': []})
+            assert breaker.state == 'closed'
+    finally:
+        configure_breaker()
+        configure_retries()
+
+
+def test_CircuitBreaker_ignores_bad_urls_while_closed():
+    breaker = configure_breaker(failure_threshold=2)
+    try:
+        for _ in range(3):
+            with pytest.raises(requests.exceptions.InvalidSchema):
+                fetch('htp:/bad url')
+        assert breaker.state == 'closed' and breaker.failures == 0
+    finally:
+        configure_breaker()
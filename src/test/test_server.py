@@ -0,0 +1,240 @@
+""" Tests for `server.py`, which sits at the repo root next to data/ 
+"""
+
+import datetime
+import gzip
+import itertools
+import json
+import pathlib
+import sys
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2]))
+import server 
+from module_two.utils_data_manipulation import summarize
+
+
+def test_ColumnarStore_round_trips_the_source_json():
+    with open(server.data_file) as f:
+        dataset = json.load(f)
+    for pos, rec in enumerate(dataset):
+        assert json.dumps(server.store.record(pos)) == json.dumps(rec) # same values, types and key order
+
+
+def test_ColumnarStore_keeps_int_usages_ints():
+    store = server.ColumnarStore([{
+        '_id': 'x', 'facility_id': 69, 'name': 'Building 69', 'address': '', 'latitude': 1.5, 'longitude': 2.5, 
+        'agency': 'A', 'sqft': 10, 'energy_records': [
+            {'timestamp': '2018-01-01T00:00:00', 'energy_type': 'Elec', 'usage': 4176}, 
+            {'timestamp': '2018-02-01T00:00:00', 'energy_type': 'Elec', 'usage': 4176.5}
+        ]
+    }])
+    usages = [energy_record['usage'] for energy_record in store.record(0)['energy_records']]
+    assert usages == [4176, 4176.5]
+    assert [type(usage) for usage in usages] == [int, float]
+
+
+def walk(client, url):
+    # follows `next` from url, returns every page 
+    pages = []
+    while url is not None:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        pages.append(resp.get_json())
+        url = pages[-1]['next']
+    return pages
+
+
+def walk_records(client, url):
+    return [rec for page in walk(client, url) for rec in page['records']]
+
+
+def test_data_numbered_pages_cover_every_record():
+    client = server.app.test_client()
+    pages = walk(client, '/data/?page_size=30')
+    assert [len(page['records']) for page in pages] == [30, 30, 30, 10]
+    assert [rec['facility_id'] for page in pages for rec in page['records']] == list(server.store.facility_id)
+    assert pages[0]['prev'] is None and pages[1]['prev'].endswith('?page=1&page_size=30')
+    assert {page['count'] for page in pages} == {100}
+
+
+def test_data_page_past_the_end_has_no_next():
+    client = server.app.test_client()
+    for url in ('/data/?page_size=30&page=5', '/data/?agency=A&page_size=500&page=3'):
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.get_json()['records'] == [] and resp.get_json()['next'] is None
+    assert client.get('/data/?page=0').status_code == 400
+    assert client.get('/data/?page=two').status_code == 400
+
+
+def test_data_page_size_is_clamped():
+    client = server.app.test_client()
+    assert len(client.get('/data/').get_json()['records']) == server.DEFAULT_PAGE_SIZE
+    with mock.patch.object(server, 'MAX_PAGE_SIZE', 40):
+        assert len(client.get('/data/?page_size=1000').get_json()['records']) == 40
+    assert client.get('/data/?page_size=0').status_code == 400
+    assert client.get('/data/?page_size=lots').status_code == 400
+
+
+def test_data_cursor_walks_in_facility_id_order():
+    client = server.app.test_client()
+    pages = walk(client, '/data/?cursor=&page_size=7&agency=A')
+    ids = [rec['facility_id'] for page in pages for rec in page['records']]
+    expected = sorted(server.store.facility_id[pos] for pos in range(len(server.store)) if server.store.get(pos, 'agency') == 'A')
+    assert ids == expected
+    assert all('agency=A' in page['next'] for page in pages[:-1])
+    assert client.get('/data/?cursor=!!').status_code == 400
+
+
+def timestamps_by_facility(client, query):
+    resp = client.get(f'/data/?page_size=500&{query}')
+    assert resp.status_code == 200
+    return {rec['facility_id']: [energy_record['timestamp'] for energy_record in rec['energy_records']] for rec in resp.get_json()['records']}
+
+
+def test_data_energy_filter_bounds_are_inclusive():
+    client = server.app.test_client()
+    facility = server.store.record(0)
+    ts = facility['energy_records'][0]['timestamp']
+    everything = [rec['timestamp'] for rec in facility['energy_records']]
+    assert timestamps_by_facility(client, f'ts_gte={ts}&ts_lte={ts}')[facility['facility_id']] == [t for t in everything if t == ts]
+    after = (datetime.datetime.fromisoformat(ts) + datetime.timedelta(seconds=1)).isoformat()
+    assert ts not in timestamps_by_facility(client, f'ts_gte={after}')[facility['facility_id']]
+    assert ts not in timestamps_by_facility(client, f'ts_lte={ts[:10]}')[facility['facility_id']] # a date alone is midnight
+    trimmed = timestamps_by_facility(client, 'ts_gte=2016-01-01&ts_lte=2016-12-31T23:59:59')[facility['facility_id']]
+    assert trimmed == sorted(t for t in everything if t.startswith('2016'))
+
+
+def test_data_energy_filter_converts_aware_timestamps_to_utc():
+    client = server.app.test_client()
+    assert timestamps_by_facility(client, 'ts_gte=2018-01-01T02:00:00%2B02:00') == timestamps_by_facility(client, 'ts_gte=2018-01-01T00:00:00')
+
+
+def test_data_energy_type_alone():
+    client = server.app.test_client()
+    trimmed = timestamps_by_facility(client, 'energy_type=Elec')
+    for pos in range(len(server.store)):
+        facility = server.store.record(pos)
+        assert trimmed[facility['facility_id']] == sorted(rec['timestamp'] for rec in facility['energy_records'] if rec['energy_type'] == 'Elec')
+
+
+def test_data_bad_timestamp_is_a_400():
+    client = server.app.test_client()
+    for endpoint in ('/data/', '/data/summary', '/data/stream'):
+        assert client.get(f'{endpoint}?ts_gte=last-tuesday').status_code == 400
+
+
+def test_data_summary_summarizes_the_trimmed_records():
+    client = server.app.test_client()
+    query = 'page_size=500&ts_gte=2017-01-01&energy_type=Fuel Oil'
+    records = client.get(f'/data/?{query}').get_json()['records']
+    for rec, summarized in zip(records, client.get(f'/data/summary?{query}').get_json()['records']):
+        assert summarized['facility_id'] == rec['facility_id']
+        assert sum(year['num_records'] for year in summarized['summary']) == len(rec['energy_records'])
+        assert {year['energy_type'] for year in summarized['summary']} <= {'Fuel Oil'}
+        assert all(year['year'] >= 2017 for year in summarized['summary'])
+
+
+def test_ColumnarStore_encodes_more_than_256_agencies():
+    facility = server.store.record(0)
+    store = server.ColumnarStore({**facility, 'agency': f'agency {i}', 'facility_id': i} for i in range(300))
+    assert store.record(299)['agency'] == 'agency 299'
+
+
+def test_data_summary_matches_the_client_summary():
+    client = server.app.test_client()
+    records = client.get('/data/?page_size=500').get_json()['records']
+    expected = [{key: rec[key] for key in ('facility_id', 'agency', 'sqft', 'summary')} for rec in summarize(records)]
+    assert walk_records(client, '/data/summary?page_size=30') == expected
+
+
+def test_data_batch_takes_only_a_list_of_ids():
+    client = server.app.test_client()
+    resp = client.post('/data/batch', json={'ids': [12, 1]})
+    assert resp.status_code == 200
+    assert [rec['facility_id'] for rec in resp.get_json()['records']] == [12, 1]
+    for body in ({'ids': '12'}, {'ids': 12}, {'ids': {'12': 1}}, [12]):
+        assert client.post('/data/batch', json=body).status_code == 400
+
+
+def test_RecordIndex_matches_a_scan_of_the_source():
+    with open(server.data_file) as f:
+        dataset = json.load(f)
+    sqfts = sorted(rec['sqft'] for rec in dataset)
+    client = server.app.test_client()
+    for agency, sqft_gte, sqft_lte, address in itertools.product(
+            (None, 'A', 'C', 'Q'), (None, sqfts[0], sqfts[50], sqfts[-1] + 1), (None, sqfts[0] - 1, sqfts[50], sqfts[-1]), (None, 'NY', 'Court', ', 3')):
+        query = {'agency': agency, 'sqft_gte': sqft_gte, 'sqft_lte': sqft_lte, 'address_contains': address}
+        expected = [
+            rec['facility_id'] for rec in dataset 
+            if (agency is None or rec['agency'] == agency) 
+            and (sqft_gte is None or rec['sqft'] >= sqft_gte) 
+            and (sqft_lte is None or rec['sqft'] <= sqft_lte) 
+            and (address is None or address in rec['address'])
+        ]
+        resp = client.get('/data/', query_string={'page_size': 500, **{key: value for key, value in query.items() if value is not None}})
+        assert [rec['facility_id'] for rec in resp.get_json()['records']] == expected, query
+
+
+def test_ResultCache_evicts_least_recently_used():
+    cache = server.ResultCache(max_size=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1 # 'a' is now the most recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_ResultCache_expires_entries_after_ttl():
+    cache = server.ResultCache(max_size=2, ttl=10)
+    with mock.patch('server.time.monotonic', return_value=100.0):
+        cache.put('a', 1)
+    with mock.patch('server.time.monotonic', return_value=110.0):
+        assert cache.get('a') == 1
+    with mock.patch('server.time.monotonic', return_value=110.5):
+        assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_cache_stats_counts_hits_and_misses():
+    client = server.app.test_client()
+    with mock.patch.object(server, 'result_cache', server.ResultCache(max_size=4, ttl=60)):
+        client.get('/data/?agency=B&page=1')
+        client.get('/data/?agency=B&page=2') # the same filters, a slice of the cached result
+        client.get('/data/summary?agency=B')
+        client.get('/data/?agency=C')
+        stats = client.get('/cache/stats').get_json()
+    assert stats == {'hits': 2, 'misses': 2, 'size': 2, 'max_size': 4, 'ttl': 60}
+
+
+def test_data_gzip_response_then_304():
+    client = server.app.test_client()
+    resp = client.get('/data/?agency=A', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200 and resp.headers['Content-Encoding'] == 'gzip'
+    etag, _ = resp.get_etag()
+    assert etag.endswith('-gz')
+    assert json.loads(gzip.decompress(resp.data))['count'] == 28
+    again = client.get('/data/?agency=A', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert again.status_code == 304 and again.data == b''
+
+
+def test_data_plain_response_then_304():
+    client = server.app.test_client()
+    resp = client.get('/data/?agency=A')
+    assert resp.status_code == 200 and 'Content-Encoding' not in resp.headers
+    etag, _ = resp.get_etag()
+    assert not etag.endswith('-gz')
+    assert client.get('/data/?agency=A', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    assert client.get('/data/?agency=A', headers={'If-None-Match': f'"{etag}-gz"'}).status_code == 304 # either encoding matches
+    assert client.get('/data/?agency=B', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
+
+
+def test_small_bodies_are_not_gzipped():
+    client = server.app.test_client()
+    resp = client.get(f'/data/{server.store.facility_id[0]}?fields=facility_id', headers={'Accept-Encoding': 'gzip'})
+    assert len(resp.data) < server.GZIP_MIN_SIZE
+    assert resp.status_code == 200 and 'Content-Encoding' not in resp.headers
+    assert not resp.get_etag()[0].endswith('-gz')
+    assert resp.get_json() == {'facility_id': server.store.facility_id[0]}
@@ -22,6 +22,15 @@ def test_categorize(list_of_colored_item_models):
     assert categorized_items_by_color == expected_res
 
 
+def test_categorize_reads_tags():
+    class Facility(pydantic.BaseModel):
+        facility_id: int
+        address: str
+    facilities = [Facility(facility_id=1, address='NY'), Facility(facility_id=2, address='NJ')]
+    categorized = categorize(facilities, 'address', ['NY', 'NJ'], tags={1: ['NY'], 2: ['NY', 'NJ']})
+    assert categorized == {'NY_dataset': facilities, 'NJ_dataset': facilities[1:]}
+
+
 # This was testing IO bound methods 
 # def test_make_dir_for_each_in_(list_of_agencies,tmp_path):
 #     filedir = tmp_path / 'tmp_splitter'
@@ -1,3 +1,4 @@
+import copy
 import pytest 
 from module_two.utils_data_manipulation import summarize
 
@@ -22,4 +23,9 @@ def test_summarize_for_empty_energy_records():
             'agency':'A',
             'sqft':45000,
             'summary':[]
-    }]
\ No newline at end of file
+    }]
+
+def test_summarize_leaves_dataset_untouched(records):
+    untouched = copy.deepcopy(records)
+    summarize(records)
+    assert records == untouched
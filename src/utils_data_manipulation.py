@@ -1,11 +1,16 @@
-import itertools
+import asyncio
+import functools
 import pydantic
-from typing import Any, Dict, List, Type, TypeVar
-from http_file import paginator
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Type, TypeVar, get_args, get_origin, get_type_hints
+from http_file import fetch, fetch_stream, paginate_records, paginator
+from async_http_file import AsyncClient, apaginator
 from itertools import chain
 
 TPydanticModel = TypeVar('TPydanticModel', bound=pydantic.BaseModel)
 
+# pydantic 2 validates in rust, there `construct` is a deprecated python path slower then validating again 
+CONSTRUCT_IS_FASTER = not hasattr(pydantic.BaseModel, 'model_construct')
+
 
 ''' flattening related methods '''
 
@@ -22,51 +27,75 @@ def sort(dataset: List[TPydanticModel], *organizor) -> List[TPydanticModel]:
     return sorted_data
 
 
-def _keys_in(nested_data_piece:List[TPydanticModel]) -> List[str]:
-    ''' returns a list of unique keys found in the nested_data_piece 
-        Args: 
-            nested_data_piece: nested value of a dict 
+def _nested_field_of(source:Type[TPydanticModel]) -> Tuple[str, Type[TPydanticModel]]:
+    ''' finds the first field of source declared as a list of pydantic models 
+        Args:
+            source: pydantic model class 
         Returns:
-            a list of unique strs 
+            tuple of the field name and the nested pydantic model class 
     '''
-    return list(set(key for model in nested_data_piece for key in model.dict().keys()))
+    for name, hint in get_type_hints(source).items():
+        args = get_args(hint)
+        if get_origin(hint) is list and args and isinstance(args[0], type) and issubclass(args[0], pydantic.BaseModel):
+            return name, args[0]
+    raise ValueError(f'{source.__name__} has no list of pydantic models to flatten')
 
 
-def _find_name_of_nested_data_piece_in(dict_obj:Dict[str,Any]) -> str:
-    ''' returns the key for a nested value 
-        Args:
-            dict_obj: py dict 
+@functools.lru_cache(maxsize=None)
+def compile_flattener(source:Type[TPydanticModel], schema:Type[TPydanticModel]) -> Callable[[TPydanticModel, bool], Iterator[TPydanticModel]]:
+    ''' works out once per (source, schema) pair, from the model definitions, which schema fields come from the parent 
+        and which from the nested models, then returns a function flattening one parent model into schema rows 
+        Args: 
+            source: pydantic model class with a list of nested pydantic models 
+            schema: pydantic model class of a flat row 
         Returns:
-            key: string key 
+            flattener(model_obj, trusted) yielding one schema row per nested model. With trusted the rows are built with 
+            `construct` instead of being validated again, as long as every schema field has the same type as the field it 
+            is copied from and CONSTRUCT_IS_FASTER (pydantic 1), otherwise they are still validated 
     '''
-    for key, value in dict_obj.items():
-        if isinstance(value, list):
-            return key 
+    name_of_key, nested_model = _nested_field_of(source)
+    source_hints, nested_hints, schema_hints = get_type_hints(source), get_type_hints(nested_model), get_type_hints(schema)
+    nested_keys = [key for key in schema.__fields__ if key in nested_hints] # a nested value wins over a parent one 
+    parent_keys = {key for key in schema.__fields__ if key in source_hints and key not in nested_hints}
+    same_types = all(schema_hints[key] == (nested_hints[key] if key in nested_hints else source_hints[key]) for key in nested_keys + list(parent_keys))
+    dump = 'dict' if CONSTRUCT_IS_FASTER else 'model_dump' # .dict is deprecated on pydantic 2 
+
+    def flattener(model_obj:TPydanticModel, trusted:bool=False) -> Iterator[TPydanticModel]:
+        build = schema.construct if trusted and same_types and CONSTRUCT_IS_FASTER else schema 
+        parent = getattr(model_obj, dump)(include=parent_keys) # serialized once per parent 
+        for nested_obj in getattr(model_obj, name_of_key):
+            flat_model_obj = dict(parent)
+            for key in nested_keys:
+                flat_model_obj[key] = getattr(nested_obj, key)
+            yield build(**flat_model_obj)
+
+    return flattener
+
+
+def iter_flatten(dataset:Iterable[TPydanticModel], schema:Type[TPydanticModel], trusted:bool=False) -> Iterator[TPydanticModel]:
+    ''' the lazy version of flatten, rows are yielded as the dataset is consumed 
+        Args: 
+            dataset: iterable of pydantic models  
+            schema: pydantic class model 
+            trusted: skip validating rows again when the dataset was already validated (see compile_flattener) 
+        Returns:
+            iterator of flatten pydantic models 
+    '''
+    for model_obj in dataset:
+        yield from compile_flattener(type(model_obj), schema)(model_obj, trusted)
 
 
-def flatten(dataset:List[TPydanticModel],schema:Type[TPydanticModel]) -> List[TPydanticModel]:
+def flatten(dataset:Iterable[TPydanticModel],schema:Type[TPydanticModel],trusted:bool=False) -> List[TPydanticModel]:
     ''' flattens a dataset and uses schema to validate datatypes
         returns a flatten dataset 
         Args: 
-            dataset: list of pydantic models  
+            dataset: iterable of pydantic models  
             schema: pydantic class model 
+            trusted: skip validating rows again when the dataset was already validated (see compile_flattener) 
         Returns:
             flatten_dataset: list of flatten pydantic models 
     '''
-    flatten_dataset = []
-    name_of_key = _find_name_of_nested_data_piece_in(dataset[0].dict())
-    for model_obj in dataset:#iterate thr dataset 
-        flat_model_obj = {}#flat model_obj 
-        nested_data_piece = getattr(model_obj, name_of_key).copy()#[{},...,{}] List DS 
-        list_of_keys = _keys_in(nested_data_piece) 
-        for i in range(len(nested_data_piece)):#len of energy_records [{},...,{}]
-            flat_model_obj = model_obj.dict().copy() # copy of model_obj 
-            for key in list_of_keys:
-                flat_model_obj[key] = getattr(nested_data_piece[i],key)
-            validated_flat_model_obj = schema(**flat_model_obj)
-            flatten_dataset.append(validated_flat_model_obj)
-            flat_model_obj = {}
-    return flatten_dataset
+    return list(iter_flatten(dataset, schema, trusted))
 
 
 ''' splitting related methods '''
@@ -83,12 +112,13 @@ def list_of_agencies_in(list_of_inst_models:List[TPydanticModel]) -> List[TPydan
 
 
 
-def categorize(list_of_inst_models:List[TPydanticModel], key_matcher:str, list_of_items:List[str]) -> Dict[str, List[TPydanticModel]]: 
+def categorize(list_of_inst_models:List[TPydanticModel], key_matcher:str, list_of_items:List[str], tags:Dict[Any, Sequence[str]]=None) -> Dict[str, List[TPydanticModel]]: 
     ''' categorizes the list_of_inst_models into a dict has a value according to each item, acting as a key, in the list_of_items
         Args:
             list_of_inst_models: list of pydantic models 
             key_matcher: string by which to obtain pydantic field attribute 
             list_of_items: a list of items to categorize dataset by 
+            tags: optional facility_id -> names of the queries a record matched (see fetch_many_queries), read instead of key_matcher 
         Returns:
             categorized_dataset: dict obj with key matching item in list and value containing list of pydantic models matching key value 
     '''
@@ -96,20 +126,31 @@ def categorize(list_of_inst_models:List[TPydanticModel], key_matcher:str, list_o
     for item in list_of_items: 
         categorized_dataset[f'{item}_dataset'] = []
         for model_obj in list_of_inst_models: 
-            if item in getattr(model_obj,key_matcher): # ~ model_obj.address 
+            matched = tags[model_obj.facility_id] if tags is not None else getattr(model_obj,key_matcher) # ~ model_obj.address 
+            if item in matched: 
                 categorized_dataset[f'{item}_dataset'].append(model_obj)
     return categorized_dataset
 
 
 ''' api_splitting related methods '''
 
-def fetch_data(url, **kwarg:Any) -> List[Dict]:
+def fetch_data(url, stream:bool=False, fields:Sequence[str]=None, **kwarg:Any) -> List[Dict]:
     ''' makes API call according to args, if none makes API call with no query str 
         Args:
-            kwarg: key word args 
+            stream: if True url is a streaming endpoint (ex /data/stream) read in one pass instead of paginating 
+            fields: only request these fields from the server, nested fields are dotted ex energy_records.usage 
+            kwarg: key word args, paginator options (timeout, client, workers, prefetch) are forwarded to it 
         Returns:
             list of python dict, a dataset [{},..,{}]
     '''
+    if fields is not None:
+        kwarg['fields'] = ','.join(fields)
+    if stream:
+        dataset = []
+        for record in fetch_stream(url, **kwarg):
+            record.pop('_id', None)
+            dataset.append(record)
+        return dataset
     list_of_datasets = []
     for _, data in paginator(url, **kwarg):
         records = data['records']
@@ -118,6 +159,98 @@ def fetch_data(url, **kwarg:Any) -> List[Dict]:
     return list(chain.from_iterable(list_of_datasets))
 
 
+def iter_records(url, limit:int=None, **filters:Any) -> Iterator[Dict]:
+    ''' the lazy version of fetch_data, records are decoded and yielded one by one (see paginate_records) and no further 
+        page is requested once `limit` records were yielded or the consumer stops iterating 
+        Args:
+            limit: stop after this many records, None for all of them 
+            filters: key word args, forwarded as query params 
+        Returns:
+            iterator of python dict without `_id`, the records the server sent are not mutated 
+    '''
+    if limit is not None and limit <= 0:
+        return 
+    for count, record in enumerate(paginate_records(url, **filters), 1):
+        yield {key: value for key, value in record.items() if key != '_id'}
+        if count == limit:
+            return 
+
+
+async def afetch_data(url, client:AsyncClient, fields:Sequence[str]=None, **kwarg:Any) -> List[Dict]:
+    ''' the async version of fetch_data, pages are pulled through apaginator on the shared client 
+        Args:
+            client: an open AsyncClient 
+            fields: only request these fields from the server, nested fields are dotted ex energy_records.usage 
+            kwarg: key word args, apaginator's timeout is forwarded to it 
+        Returns:
+            list of python dict, a dataset [{},..,{}]
+    '''
+    if fields is not None:
+        kwarg['fields'] = ','.join(fields)
+    dataset = []
+    async for _, data in apaginator(url, client, **kwarg):
+        records = data['records']
+        _remove_from(records, '_id')
+        dataset.extend(records)
+    return dataset
+
+
+def fetch_data_concurrently(url, queries:List[Dict[str, Any]], max_in_flight:int=10, interval:float=0.0) -> List[List[Dict]]:
+    ''' runs afetch_data for every query at once on one event loop 
+        Args:
+            queries: one dict of key word args per fetch_data call, ex [{'address_contains': 'NY'}, {'address_contains': 'NJ'}] 
+            max_in_flight: requests allowed in flight at once across all queries 
+            interval: minimum spacing in seconds between request starts across all queries 
+        Returns:
+            list of datasets in the order of queries 
+    '''
+    async def gather():
+        async with AsyncClient(max_in_flight=max_in_flight, interval=interval) as client:
+            return await asyncio.gather(*(afetch_data(url, client, **query) for query in queries))
+    return asyncio.run(gather())
+
+
+def fetch_many_queries(url, queries:Dict[str, Dict[str, Any]], tag:str=None, max_in_flight:int=10, interval:float=0.0) -> List[Dict]:
+    ''' runs several named filter sets concurrently (see fetch_data_concurrently) and merges them, a facility matched by 
+        more than one query is kept once 
+        Args:
+            queries: query name -> key word args for one fetch, ex {'NY': {'address_contains': 'NY'}, 'NJ': {'address_contains': 'NJ'}} 
+            tag: if given every record gets this key holding the names of the queries it matched, in the order of queries 
+            max_in_flight: requests allowed in flight at once across all queries 
+            interval: minimum spacing in seconds between request starts across all queries 
+        Returns:
+            list of python dict without duplicate facility_id, in the order they were first seen 
+    '''
+    names = list(queries)
+    list_of_datasets = fetch_data_concurrently(url, [queries[name] for name in names], max_in_flight, interval)
+    merged = {}
+    for name, dataset in zip(names, list_of_datasets):
+        for record in dataset:
+            kept = merged.setdefault(record['facility_id'], record)
+            if tag is not None:
+                kept.setdefault(tag, []).append(name)
+    return list(merged.values())
+
+
+def fetch_by_ids(base_url:str, facility_ids:List[Any], batch_size:int=100) -> List[Dict]:
+    ''' fetches many records by facility id through the batch endpoint, batch_size ids per request 
+        Args:
+            base_url: basic url string, ex http://localhost:8080 
+            facility_ids: list of facility ids 
+            batch_size: number of ids sent per request 
+        Returns:
+            list of python dict in the requested order, ids that do not exist are left out 
+    '''
+    dataset = []
+    for i in range(0, len(facility_ids), batch_size):
+        batch = facility_ids[i:i + batch_size]
+        _, data = fetch(f'{base_url}/data/batch', ids=','.join(str(facility_id) for facility_id in batch))
+        records = data['records']
+        _remove_from(records, '_id')
+        dataset.extend(records)
+    return dataset
+
+
 def pydantic_converter_of(dataset:List[Dict],schema:Type[TPydanticModel]) -> List[TPydanticModel]:
     ''' converts a list of python dict into a list of pydantic model 
         Args:
@@ -130,7 +263,7 @@ def pydantic_converter_of(dataset:List[Dict],schema:Type[TPydanticModel]) -> Lis
 
 
 def _remove_from(dataset:List[Dict], *entries:str) -> None:
-    ''' removes from a python dict an entry 
+    ''' removes from a python dict an entry, entries that are already missing (ex not requested with `fields`) are skipped 
         Args:
             dataset: list of python dict 
             entries: key args you wish to rm 
@@ -139,59 +272,62 @@ def _remove_from(dataset:List[Dict], *entries:str) -> None:
     '''
     for data_obj in dataset:
         for entry in entries:
-            data_obj.pop(entry)
+            data_obj.pop(entry, None)
 
 
 
 ''' summary related methods '''
 
+summary_dropped = ('name', 'address', 'longitude', 'latitude', 'energy_records') # fields not carried over into a summarized record 
+
+
 def summarize(dataset:List[Dict]) -> List[Dict]:
-    ''' converts a list of records, in similar structure to server API endpoint, into a list of summarized records 
+    ''' converts a list of records, in similar structure to server API endpoint, into a list of new summarized records. 
+        The dataset is left untouched so there is no need to copy it first 
         Args:
             dataset: list of python dict 
         Returns:
-            dataset: list of summarized dict 
+            list of summarized dict 
     '''
-    _remove_from(dataset,'name', 'address', 'longitude', 'latitude')
-    for data_obj in dataset:
-        sorted_energy_records = sorted(data_obj['energy_records'],key=lambda data_obj:(data_obj['energy_type'], data_obj['timestamp']) )
-        data_obj['energy_records'] = sorted_energy_records
-        summarized_dataset = _summarize_energy_records(data_obj)
-        data_obj['summary'] = summarized_dataset
-    _round(dataset)
-    return dataset 
+    return [_summarized(data_obj, _summarize_energy_records(data_obj)) for data_obj in dataset]
 
 
-def _summarize_energy_records(data_obj:Dict) -> List[Dict]: 
-    ''' takes an object containing an energy_records entry, removes it and summarizes for each year per energy type
+def _summarized(data_obj:Dict, summary:List[Dict]) -> Dict:
+    ''' builds a summarized record 
         Args:
-            dataset: list of python dict 
+            data_obj: python dict 
+            summary: list of summarized energy records 
         Returns:
-            list_of_summarized_energy_records 
+            a new dict with the fields of data_obj that are not in summary_dropped and the summary 
     '''
-    removed_energy_records = data_obj.pop('energy_records')#rm [{},...,{}]
-    grouped_energy_record = itertools.groupby(removed_energy_records, key=lambda energy_record: (energy_record['energy_type'], energy_record['timestamp'][:4]))  
-    list_of_summarized_energy_records = []
-    for (energy_type, year), grp in grouped_energy_record:
-        list_of_usage_records = [record_obj['usage'] for record_obj in list(grp)]
-        sum_obj = {
-            'year': int(year),
-            'energy_type': energy_type,
-            'num_records': len(list_of_usage_records),
-            'average_usage_per_sqft': (sum(list_of_usage_records) / len(list_of_usage_records))/ data_obj['sqft'] 
-        }
-        list_of_summarized_energy_records.append(sum_obj)
-    return list_of_summarized_energy_records
+    summarized = {key: value for key, value in data_obj.items() if key not in summary_dropped}
+    summarized['summary'] = summary 
+    return summarized 
 
 
-def _round(dataset:List[Dict]) -> None:
-    ''' rounds the avergae_usgae_per_sqft to 4 significant figures 
+def _summarize_energy_records(data_obj:Dict) -> List[Dict]: 
+    ''' summarizes the energy_records of data_obj for each year per energy type in a single pass, a running [sum, count] 
+        is kept per (energy_type, year) and only those keys are sorted 
         Args:
-            dataset: list of python dict 
+            data_obj: python dict with energy_records and sqft 
         Returns:
-            None -> mutates dataset 
+            list_of_summarized_energy_records sorted by energy_type and year 
     '''
-    for data_obj in dataset:
-        for summary_obj in data_obj['summary']:
-            summary_obj['average_usage_per_sqft'] = round(summary_obj['average_usage_per_sqft'], 4)
-
+    accumulators = {}
+    for energy_record in data_obj['energy_records']:
+        key = (energy_record['energy_type'], energy_record['timestamp'][:4])
+        accumulator = accumulators.get(key)
+        if accumulator is None:
+            accumulators[key] = [energy_record['usage'], 1]
+        else:
+            accumulator[0] += energy_record['usage']
+            accumulator[1] += 1 
+    return [
+        {
+            'year': int(year),
+            'energy_type': energy_type,
+            'num_records': count,
+            'average_usage_per_sqft': round((total / count) / data_obj['sqft'], 4)
+        }
+        for (energy_type, year), (total, count) in sorted(accumulators.items())
+    ]